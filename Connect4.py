@@ -2,6 +2,7 @@ import sys
 from final_board import *
 from final_players import *
 import random
+from final_latency import *
 
 class Connect4:
     '''Instances of this class simulate an interactive Connect-4 game.'''
@@ -21,6 +22,7 @@ class Connect4:
         self.nrows = self.board.getRows()
         self.ncols = self.board.getCols()
         self.moves = []
+        self.latency = LatencyRecorder()
 
     def show(self):
         '''Print the board to the terminal, along with the player to move.'''
@@ -103,7 +105,9 @@ class Connect4:
                         self.makeMove(col, 1)
                         self.show()
                 else:  # player 2 = computer
-                    col = self.opponent.chooseMove(self.board.clone(), 2)
+                    name = self.opponent.__class__.__name__
+                    col = self.latency.time_move(name, self.opponent,
+                        self.board.clone(), 2)
                     self.makeMove(col, 2)
                     print 'Computer plays on column %d...' % col
                     self.show()
@@ -133,7 +137,7 @@ class Connect4:
                 print >> sys.stderr, 'Board error; try again...'
 
 if __name__ == '__main__':
-    players = ['random', 'simple', 'better', 'monty', "minimax"]
+    players = ['random', 'simple', 'better', 'monty', "mcts", "minimax"]
 
     print 'Computer players: %s' % players
     player = raw_input('Enter name of computer player: ')
@@ -145,16 +149,42 @@ if __name__ == '__main__':
     elif player == 'better':
         opponent = BetterPlayer()
     elif player == 'monty':
-        nsims = int(raw_input('Enter number of simulations per move: '))
+        # the default is whatever Connect4Calibrate.py found fits in time
+        settings = {"monty_sims": 100}
+        execfile("minimax.config", settings)
+        nsims = raw_input('Enter number of simulations per move [%d]: ' %
+            settings["monty_sims"])
+        nsims = int(nsims or settings["monty_sims"])
         assert nsims > 0
         player = SimplePlayer()
         opponent = Monty(nsims, player)
+    elif player == "mcts":
+        # the same goes for Mcts's games, which are for the whole move
+        settings = {"mcts_games": 1000, "workers": 0}
+        execfile("minimax.config", settings)
+        ngames = raw_input('Enter number of games per move [%d]: ' %
+            settings["mcts_games"])
+        ngames = int(ngames or settings["mcts_games"])
+        assert ngames > 0
+        opponent = Mcts(ngames, 1, workers=settings["workers"] or None)
     elif player == "minimax":
         monty = 250
         depth = 6
+        monty_mode = "fixed"
+        search = "tree"
+        workers = 0
+        time = 0
+        increment = 0
+        cache_file = ""
+        store_file = ""
+        adjudicate = False
+        adjudicate_plies = 0
         execfile("minimax.config")
         assert depth > 0
-        opponent = Minimax(1, depth, monty)
+        opponent = Minimax(1, depth, monty, monty_mode=monty_mode,
+            search=search, workers=workers, time=time, increment=increment,
+            cache_file=cache_file, store=store_file or None,
+            adjudicate=adjudicate, adjudicate_plies=adjudicate_plies or None)
     else:
         print >> sys.stderr, 'Invalid player name.  Exiting.'
         sys.exit(1)
@@ -167,4 +197,8 @@ if __name__ == '__main__':
 
     game = Connect4(opponent, toMove)
     game.play()
+    print
+    game.latency.report()
+    if hasattr(opponent, "close"):
+        opponent.close()
 
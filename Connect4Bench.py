@@ -0,0 +1,69 @@
+'''
+Connect4Bench.py
+
+This module runs players on a corpus of positions with known right
+answers (see final_bench.py), and reports for each phase of the game how
+many they got right, how much work they did and how long they took, so
+that engines and settings can be compared by speed at the same accuracy.
+
+Usage:
+  python Connect4Bench.py CORPUS PLAYER [PLAYER ...]
+  python Connect4Bench.py CORPUS --make N [--seed S]
+
+Players are given as for Connect4Match.py, e.g. "minimax:6:250",
+"minimax:6:250:search=mtdf" or "monty:100" (see make_player() in
+final_players.py). "right" is the percentage of right answers, "work" the
+mean positions searched or games simulated per move, "time" the mean
+seconds per move and "to right" the mean seconds per right answer.
+'''
+
+import sys
+import random
+import argparse
+from final_bench import *
+from final_latency import PHASES
+from final_players import make_player
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Run players on a corpus of solved positions.")
+    parser.add_argument("corpus")
+    parser.add_argument("players", nargs="*")
+    parser.add_argument("--make", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args()
+
+    if options.seed is not None:
+        random.seed(options.seed)
+
+    if options.make:
+        def found(entry):
+            print "%s %s %s, value %d, answers %s" % (entry[2], entry[3],
+                entry[0], entry[4], entry[6])
+            sys.stdout.flush()
+
+        save_corpus(make_corpus(options.make, report=found), options.corpus)
+        sys.exit(0)
+
+    corpus = load_corpus(options.corpus)
+    print "%-32s %-10s %5s %6s %10s %8s %8s" % ("player", "phase", "count",
+        "right", "work", "time", "to right")
+    for spec in options.players:
+        # player numbers only matter to the players' own bookkeeping, as
+        # each position says who is to move
+        player = make_player(spec, 1)
+        totals = run_bench(player, corpus)
+        for name in [p for p, limit in PHASES] + ["all"]:
+            if name not in totals:
+                continue
+            count, right, amount, seconds, right_seconds = totals[name]
+            to_right = "-"
+            if right:
+                to_right = "%.3f" % (right_seconds / right)
+            print "%-32s %-10s %5d %5.1f%% %10.0f %8.3f %8s" % (spec, name,
+                count, 100.0 * right / count, float(amount) / count,
+                seconds / count, to_right)
+        if hasattr(player, "close"):
+            player.close()
+        sys.stdout.flush()
@@ -0,0 +1,334 @@
+'''
+Connect4Calibrate.py
+
+This module times this machine on a set of positions and writes the
+strongest settings that choose a move within a target time into
+minimax.config, instead of the values I timed by hand on my computer.
+
+Usage:
+  python Connect4Calibrate.py TARGET_SECONDS [--positions CORPUS]
+                              [--percentile P] [--config FILE]
+
+The positions are those of a benchmark corpus (see Connect4Bench.py),
+bench.txt by default. The target is met when P percent of the moves
+(90 by default) take at most TARGET_SECONDS.
+
+Minimax is set up from the rest of the config file (search, monty_mode,
+workers and adjudication) the same way Connect4.py sets it up, so it's the
+engine that will play that gets timed. The time a move takes is the search
+plus monty games for each move the search leaves undecided, so the search
+is timed at each depth, and the games separately; the settings are the
+deepest search that still leaves time for at least MIN_MONTY games per
+undecided move, with as many games as then fit. Monty (monty_sims) and
+Mcts (mcts_games) get as many games per move as are predicted to fit.
+Every prediction is then checked by timing the settings for real, with
+fewer games if they're too slow after all, or more if they're well inside
+the target.
+'''
+
+import os
+import re
+import sys
+import time
+import argparse
+from final_bench import *
+from final_latency import *
+from final_players import *
+
+# fewer games than this per move and Monty's choice is mostly luck, so a
+# depth that doesn't leave time for them is too deep
+MIN_MONTY = 50
+
+# the deepest search tried
+MAX_DEPTH = 10
+
+
+def positions(path):
+    """Returns a list of (board, player to move) from a corpus file."""
+
+    result = []
+    for entry in load_corpus(path):
+        board = Connect4Board()
+        board.setKey(entry[0])
+        result.append((board, entry[1]))
+    return result
+
+
+def read_config(path):
+    """
+    Returns a dictionary of the settings in a config file, with the same
+    defaults as Connect4.py for any it leaves out.
+    """
+
+    settings = {"monty_mode": "fixed", "search": "tree", "workers": 0,
+        "adjudicate": False, "adjudicate_plies": 0}
+    if os.path.exists(path):
+        execfile(path, settings)
+    return settings
+
+
+def make_minimax(settings, depth, monty):
+    """
+    Returns a Minimax set up from the config 'settings' as Connect4.py sets
+    it up, but with this depth and monty, and without the clock, the cache
+    and the store, which would make the times mean nothing.
+    """
+
+    return Minimax(1, depth, monty, monty_mode=settings["monty_mode"],
+        search=settings["search"], workers=settings["workers"],
+        adjudicate=settings["adjudicate"],
+        adjudicate_plies=settings["adjudicate_plies"] or None)
+
+
+def make_mcts(settings, games):
+    """Returns an Mcts set up from the config 'settings' as Connect4.py does."""
+
+    return Mcts(games, 1, workers=settings["workers"] or None)
+
+
+def time_searches(boards, settings, max_seconds, percentile):
+    """
+    Times Minimax's search (without Monty) on every position at each depth,
+    stopping at the first depth whose slow moves take over max_seconds.
+    Returns a dictionary mapping each depth to a list of (seconds,
+    undecided moves), one per position.
+    """
+
+    result = {}
+    for depth in range(1, MAX_DEPTH + 1):
+        minimax = make_minimax(settings, depth, 1)
+        times = []
+        histogram = LatencyHistogram()
+        for board, player in boards:
+            started = time.time()
+            move_table = minimax.move_table(board, player, depth)
+            seconds = time.time() - started
+            histogram.record(seconds)
+            undecided = len(move_table[0])
+            if move_table[1]:
+                undecided = 0
+            times.append((seconds, undecided))
+        minimax.close()
+        result[depth] = times
+        print "depth %d: search %.3fs at p%d" % (depth,
+            histogram.percentile(percentile), percentile)
+        sys.stdout.flush()
+        if histogram.percentile(percentile) > max_seconds:
+            break
+    return result
+
+
+def time_rollouts(boards, games=20, **options):
+    """
+    Returns a list of how many seconds one of Monty's simulated games takes
+    from each position (games from the opening take much longer than games
+    from the endgame, so one average for all of them would be no good).
+    'options' are for the Monty, e.g. to adjudicate its games.
+    """
+
+    monty = Monty(1, 1, **options)
+    result = []
+    for board, player in boards:
+        moves = board.possibleMoves()
+        started = time.time()
+        for i in range(games):
+            monty.rollout(board, moves[i % len(moves)], player)
+        result.append((time.time() - started) / games)
+    return result
+
+
+def time_worker_rollouts(boards, settings, games=20):
+    """
+    Returns a list of how many seconds a simulated game takes from each
+    position when Minimax (set up from the config 'settings', with workers
+    and the fixed monty_mode) hands them to its workers, as a share of the
+    time they all take, so with the workers' adjudication and overheads.
+    """
+
+    minimax = make_minimax(settings, 1, 1)
+    result = []
+    for board, player in boards:
+        moves = board.possibleMoves()
+        started = time.time()
+        minimax.parallel.monty(board, player, moves, games,
+            minimax.adjudicator)
+        result.append((time.time() - started) / (games * len(moves)))
+    minimax.close()
+    return result
+
+
+def predict(times, monty, per_game, percentile):
+    """
+    Returns the time that 'percentile' percent of moves would take with
+    searches taking 'times' and 'monty' games per undecided move, each
+    taking 'per_game' (one for each position).
+    """
+
+    histogram = LatencyHistogram()
+    for i in range(len(times)):
+        seconds, undecided = times[i]
+        histogram.record(seconds + monty * undecided * per_game[i])
+    return histogram.percentile(percentile)
+
+
+def calibrate(boards, settings, target, percentile):
+    """
+    Returns the predicted (depth, monty, monty_sims, mcts_games) for the
+    target, with Minimax set up from the config 'settings', or None for
+    depth and monty if no depth leaves time for MIN_MONTY games.
+    """
+
+    # Monty plays its own games plainly, but Minimax's Montys adjudicate
+    # theirs as the config says, and in the fixed mode with workers, the
+    # workers play them, so that's what's timed
+    plain = time_rollouts(boards)
+    if settings["workers"] and settings["monty_mode"] == "fixed":
+        per_game = time_worker_rollouts(boards, settings)
+    else:
+        per_game = time_rollouts(boards, adjudicate=settings["adjudicate"],
+            adjudicate_plies=settings["adjudicate_plies"] or None)
+    print "one simulated game: %.4fs on average" % (sum(plain) /
+        len(plain))
+    searches = time_searches(boards, settings, target, percentile)
+
+    best = (None, None)
+    for depth in sorted(searches):
+        times = searches[depth]
+        if predict(times, MIN_MONTY, per_game, percentile) > target:
+            continue
+
+        # the most games that still fit, found by halving the gap
+        low = MIN_MONTY
+        high = MIN_MONTY
+        while predict(times, high * 2, per_game, percentile) <= target:
+            high *= 2
+            if high > 1000000:
+                break
+        high *= 2
+        while high - low > 1:
+            middle = (low + high) // 2
+            if predict(times, middle, per_game, percentile) <= target:
+                low = middle
+            else:
+                high = middle
+        best = (depth, low)
+
+    # Monty simulates n games for every move, seven at the most; Mcts
+    # simulates n in all, each a little slower for the tree around it
+    slow = LatencyHistogram()
+    for seconds in plain:
+        slow.record(seconds)
+    slow = slow.percentile(percentile)
+    monty_sims = max(1, int(target / (7 * slow)))
+    mcts_games = max(1, int(target / (1.2 * slow)))
+    return (best[0], best[1], monty_sims, mcts_games)
+
+
+def check(boards, player, percentile):
+    """
+    Returns the time 'percentile' percent of a player's moves take, for
+    real, and closes the player.
+    """
+
+    histogram = LatencyHistogram()
+    for board, toMove in boards:
+        started = time.time()
+        player.chooseMove(board.clone(), toMove)
+        histogram.record(time.time() - started)
+    if hasattr(player, "close"):
+        player.close()
+    return histogram.percentile(percentile)
+
+
+def fit(boards, make, n, smallest, target, percentile, name):
+    """
+    Times the player that make(n) returns, and if it's too slow, tries again
+    with fewer games until it fits or n is down to 'smallest'; if it's well
+    inside the target, tries once with more. Returns n.
+    """
+
+    seconds = check(boards, make(n), percentile)
+    if seconds < 0.8 * target:
+        more = int(n * target / seconds)
+        more_seconds = check(boards, make(more), percentile)
+        print "%s %d: %.3fs is too fast, %d: %.3fs" % (name, n, seconds,
+            more, more_seconds)
+        if more_seconds <= target:
+            return more
+    while seconds > target and n > smallest:
+        print "%s %d: %.3fs is too slow" % (name, n, seconds)
+        n = max(smallest, int(n * target / seconds))
+        seconds = check(boards, make(n), percentile)
+    print "%s %d: %.3fs at p%d (target %.3fs)" % (name, n, seconds,
+        percentile, target)
+    return n
+
+
+def write_config(path, settings):
+    """
+    Sets each of 'settings' (a dictionary of names to values) in the config
+    file, replacing the line that sets it if there is one and adding one at
+    the end if not, and leaving everything else as it is.
+    """
+
+    # lines keep their own line endings, and new ones get the first line's,
+    # so a file edited on Windows stays as it was apart from the settings
+    lines = []
+    if os.path.exists(path):
+        f = open(path, "rb")
+        lines = f.read().splitlines(True)
+        f.close()
+    newline = "\n"
+    if lines and lines[0].endswith("\r\n"):
+        newline = "\r\n"
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += newline
+
+    done = set()
+    for i in range(len(lines)):
+        match = re.match(r"(\w+)\s*=[^\r\n]*(\r?\n)", lines[i])
+        if match and match.group(1) in settings:
+            name = match.group(1)
+            lines[i] = "%s = %r%s" % (name, settings[name], match.group(2))
+            done.add(name)
+    for name in sorted(settings):
+        if name not in done:
+            lines.append("%s = %r%s" % (name, settings[name], newline))
+
+    f = open(path, "wb")
+    f.write("".join(lines))
+    f.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Find the strongest settings that fit a time per move.")
+    parser.add_argument("target", type=float)
+    parser.add_argument("--positions", default="bench.txt")
+    parser.add_argument("--percentile", type=float, default=90)
+    parser.add_argument("--config", default="minimax.config")
+    options = parser.parse_args()
+
+    boards = positions(options.positions)
+    settings = read_config(options.config)
+    depth, monty, monty_sims, mcts_games = calibrate(boards, settings,
+        options.target, options.percentile)
+    if depth is None:
+        print >> sys.stderr, 'No depth leaves time for %d games per move.  ' \
+            'Exiting.' % MIN_MONTY
+        sys.exit(1)
+
+    # the predictions leave out the win/block checks, the threat search and
+    # Mcts's tree, so if they're out, fewer games are played until they fit
+    # for real
+    monty = fit(boards, lambda n: make_minimax(settings, depth, n), monty,
+        MIN_MONTY, options.target, options.percentile,
+        "depth %d, monty" % depth)
+    monty_sims = fit(boards, lambda n: Monty(n, 1), monty_sims, 1,
+        options.target, options.percentile, "monty_sims")
+    mcts_games = fit(boards, lambda n: make_mcts(settings, n), mcts_games, 1,
+        options.target, options.percentile, "mcts_games")
+
+    write_config(options.config, {"depth": depth, "monty": monty,
+        "monty_sims": monty_sims, "mcts_games": mcts_games})
+    print "written to %s" % options.config
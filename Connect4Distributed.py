@@ -0,0 +1,396 @@
+'''
+Connect4Distributed.py
+
+This module spreads simulated games over many machines. A coordinator
+splits the work into batches and hands them out over TCP to any number of
+workers, which play them and send the results back. If a worker dies or
+stops answering, its batch goes back in the queue for another worker; if a
+batch fails (e.g. a player can't be made), the error is sent back and the
+run stops with it.
+
+Usage:
+  python Connect4Distributed.py coordinator GAMES PLAYER1 PLAYER2
+                                --authkey KEY [--host ADDRESS] [options]
+  python Connect4Distributed.py worker HOST --authkey KEY [options]
+
+where PLAYER1 and PLAYER2 are player descriptions like "minimax:5:100" or
+"monty:100" (see make_player() in final_players.py). Start the coordinator
+first, then as many workers as there are cores, on as many machines as
+there are.
+
+Whatever arrives on a connection is unpickled, so anyone who can connect
+with the right key can run code on the other end. There's no default key,
+and the coordinator only listens on 127.0.0.1 unless --host gives the
+address to listen on (e.g. 0.0.0.0 for every interface); choose a long
+random key and only open the port on a network you trust.
+'''
+
+import sys
+import time
+import Queue
+import random
+import socket
+import argparse
+import threading
+import traceback
+from multiprocessing.connection import Listener, Client
+from final_board import *
+from final_players import *
+from Connect4Sim import Connect4Sim
+
+DEFAULT_PORT = 6000
+
+
+# a worker tells the coordinator it's still going at most this often, in
+# seconds
+BEAT_INTERVAL = 1.0
+
+
+class CoordinatorGone(Exception):
+    '''
+    Raised inside a worker when the coordinator has hung up (or given up on
+    it) in the middle of a batch, so that it isn't taken for the batch
+    failing.
+    '''
+    pass
+
+
+def run_batch(batch, beat=None):
+    """
+    Does the work of one batch, calling beat() (if given) after each game
+    or simulation. There are two kinds:
+        ("games", spec1, spec2, n, seed) plays n games between two players,
+        with a random player going first each time, and returns
+        (player 1 wins, player 2 wins, draws)
+        ("rollouts", key, move, player, n, seed) runs n Monty simulations
+        of 'player' making 'move' in the position with that board key, and
+        returns the number of wins
+    """
+
+    kind = batch[0]
+    if kind == "games":
+        spec1, spec2, n, seed = batch[1:]
+        random.seed(seed)
+        player1 = make_player(spec1, 1)
+        player2 = make_player(spec2, 2)
+        tally = [0, 0, 0]
+        for i in range(n):
+            winner = Connect4Sim(player1, player2,
+                random.choice([1, 2])).play()
+            if winner == 1:
+                tally[0] += 1
+            elif winner == 2:
+                tally[1] += 1
+            else:
+                tally[2] += 1
+            if beat is not None:
+                beat()
+        return tuple(tally)
+
+    elif kind == "rollouts":
+        key, move, player, n, seed = batch[1:]
+        random.seed(seed)
+        board = Connect4Board()
+        board.setKey(key)
+        monty = Monty(n, player)
+        wins = 0
+        for i in range(n):
+            wins += monty.rollout(board, move, player)
+            if beat is not None:
+                beat()
+        return wins
+
+    raise ValueError("Unknown kind of batch: %s" % kind)
+
+
+def check_batch(batch):
+    """
+    Raises an error now, rather than in every worker, if the players of a
+    batch of games can't be made.
+    """
+
+    if batch[0] == "games":
+        for spec in batch[1:3]:
+            player = make_player(spec, 1)
+            if hasattr(player, "close"):
+                player.close()
+
+
+def worker(address, authkey):
+    """
+    Connects to a coordinator and works through the batches it sends until
+    it says there are none left (or goes away). Sends ("beat", batch id) now
+    and then while it works, so the coordinator knows it's alive, and then
+    ("result", batch id, result), or ("error", batch id, traceback) if the
+    batch failed.
+    Arguments:
+        address: the coordinator's (host, port)
+        authkey: the shared secret the coordinator expects
+    Returns the number of batches done.
+    """
+
+    conn = Client(address, authkey=authkey)
+    done = 0
+
+    def send(message):
+        try:
+            conn.send(message)
+        except (IOError, EOFError, socket.error):
+            raise CoordinatorGone
+
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                break
+            if task is None:
+                break
+            batch_id, batch = task
+            last = [time.time()]
+
+            def beat():
+                if time.time() - last[0] >= BEAT_INTERVAL:
+                    send(("beat", batch_id))
+                    last[0] = time.time()
+
+            try:
+                result = run_batch(batch, beat)
+            except CoordinatorGone:
+                break
+            except Exception:
+                send(("error", batch_id, traceback.format_exc()))
+                continue
+            send(("result", batch_id, result))
+            done += 1
+    except CoordinatorGone:
+        pass
+    finally:
+        conn.close()
+    return done
+
+
+class Coordinator:
+    """
+    Hands batches out to workers as they connect and collects the results.
+    Each worker connection gets its own thread, which sends one batch at a
+    time and waits for its result. Workers stay connected between runs
+    until close().
+    """
+
+    def __init__(self, authkey, address=("127.0.0.1", DEFAULT_PORT),
+        timeout=600):
+        """
+        Attributes:
+            authkey: the shared secret workers have to know; required, as
+            connections carry pickles (see the top of this file)
+            address: the (host, port) to listen on; only this machine can
+            connect unless host is another of its addresses, or "0.0.0.0"
+            for all of them
+            listener: the socket workers connect to
+            timeout: how many seconds a worker can go without finishing a
+            game or simulation before it's given up on and its batch handed
+            to someone else
+            todo: queue of ((run, batch id), batch) still to be done
+            run_count: how many runs there have been, so that a result from
+            an earlier run (that stopped with an error) isn't taken for one
+            of this run's
+            results: maps batch ids to results
+            error: the traceback of a batch that failed this run, or None
+            lost: how many times a batch had to be handed out again
+            closed: whether close() has been called
+        """
+
+        assert authkey, "Workers must have a key to connect with."
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+        self.timeout = timeout
+        self.todo = Queue.Queue()
+        self.run_count = 0
+        self.results = {}
+        self.error = None
+        self.total = 0
+        self.lost = 0
+        self.progress = None
+        self.closed = False
+        self.lock = threading.Condition()
+
+        # workers are accepted from now until close(), for every run()
+        # (workers that are still connected keep working on later runs)
+        acceptor = threading.Thread(target=self.accept)
+        acceptor.daemon = True
+        acceptor.start()
+
+    def run(self, batches, progress=None):
+        """
+        Does all the batches and returns their results, in the same order,
+        or raises a RuntimeError if one of them fails.
+        Arguments:
+            batches: a list of batches (see run_batch())
+            progress: if given, called as progress(batch id, result) as each
+            result comes in
+        """
+
+        for batch in batches:
+            check_batch(batch)
+
+        self.lock.acquire()
+        self.run_count += 1
+        self.results = {}
+        self.error = None
+        self.total = len(batches)
+        self.progress = progress
+        self.lock.release()
+        for batch_id in range(len(batches)):
+            self.todo.put(((self.run_count, batch_id), batches[batch_id]))
+
+        self.lock.acquire()
+        while len(self.results) < self.total and self.error is None:
+            self.lock.wait(1.0)
+        error = self.error
+        self.lock.release()
+
+        if error is not None:
+            # the rest of the batches would only be thrown away
+            while True:
+                try:
+                    self.todo.get_nowait()
+                except Queue.Empty:
+                    break
+            raise RuntimeError("A batch failed in a worker:\n%s" % error)
+        return [self.results[i] for i in range(self.total)]
+
+    def finished(self):
+        """Returns whether every batch has a result."""
+
+        self.lock.acquire()
+        done = len(self.results) >= self.total
+        self.lock.release()
+        return done
+
+    def accept(self):
+        """Accepts workers until close(), starting a thread for each."""
+
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except Exception, e:
+                if self.closed:
+                    return
+                # a worker with the wrong key, or one that hung up straight
+                # away, shouldn't stop the others from connecting
+                print >> sys.stderr, "Rejected worker: %s" % e
+                continue
+            handler = threading.Thread(target=self.serve, args=(conn,))
+            handler.daemon = True
+            handler.start()
+
+    def serve(self, conn):
+        """Feeds batches to one worker until close()."""
+
+        while True:
+            try:
+                batch_id, batch = self.todo.get(timeout=0.5)
+            except Queue.Empty:
+                if self.closed:
+                    try:
+                        conn.send(None)
+                    except (IOError, EOFError, socket.error):
+                        pass
+                    conn.close()
+                    return
+                continue
+
+            try:
+                conn.send((batch_id, batch))
+                while True:
+                    if not conn.poll(self.timeout):
+                        raise IOError("worker timed out")
+                    message = conn.recv()
+                    if message[0] != "beat":
+                        break
+                kind, result_id, result = message
+            except (IOError, EOFError, socket.error):
+                # the worker's gone, so its batch goes back for someone else
+                self.todo.put((batch_id, batch))
+                self.lock.acquire()
+                self.lost += 1
+                self.lock.release()
+                conn.close()
+                return
+
+            # a result from a run that stopped with an error is thrown away;
+            # a worker that's given up on is hung up on, so its result is
+            # never read and each batch's result only comes in once, but
+            # that's checked too, just to be safe
+            self.lock.acquire()
+            run, result_id = result_id
+            if run == self.run_count and kind == "error":
+                self.error = result
+            elif run == self.run_count and result_id not in self.results:
+                self.results[result_id] = result
+                if self.progress is not None:
+                    self.progress(result_id, result)
+            self.lock.notify_all()
+            self.lock.release()
+
+    def close(self):
+        """Stops listening for workers, and lets the connected ones go."""
+
+        self.closed = True
+        self.listener.close()
+
+
+def game_batches(games, spec1, spec2, batch_size, seed):
+    """Splits 'games' games between two players into batches."""
+
+    batches = []
+    i = 0
+    while i < games:
+        n = min(batch_size, games - i)
+        batches.append(("games", spec1, spec2, n, seed + i))
+        i += n
+    return batches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Play games across many machines.")
+    parser.add_argument("role", choices=["coordinator", "worker"])
+    parser.add_argument("args", nargs="*")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--host", default="127.0.0.1",
+        help="the address the coordinator listens on")
+    parser.add_argument("--authkey", required=True)
+    parser.add_argument("--batch", type=int, default=10)
+    parser.add_argument("--timeout", type=int, default=600,
+        help="seconds a worker can take over one game")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    if options.role == "worker":
+        host = options.args[0]
+        done = worker((host, options.port), options.authkey)
+        print "%d batches done" % done
+        sys.exit(0)
+
+    games, spec1, spec2 = int(options.args[0]), options.args[1], \
+        options.args[2]
+    batches = game_batches(games, spec1, spec2, options.batch, options.seed)
+    coordinator = Coordinator(options.authkey, (options.host, options.port),
+        options.timeout)
+    print "Listening on %s port %d for workers..." % (options.host,
+        options.port)
+
+    def progress(batch_id, result):
+        print "batch %d: %d %d %d" % ((batch_id,) + result)
+        sys.stdout.flush()
+
+    started = time.time()
+    results = coordinator.run(batches, progress)
+    coordinator.close()
+    tally = [sum([r[i] for r in results]) for i in range(3)]
+    print "%s wins %d, %s wins %d, %d draws" % (spec1, tally[0], spec2,
+        tally[1], tally[2])
+    print "%.1f games per second, %d batches handed out again" % (
+        games / (time.time() - started), coordinator.lost)
@@ -0,0 +1,178 @@
+'''
+Connect4Match.py
+
+This module plays a match between two computer players and stops as soon
+as a sequential probability ratio test (SPRT) can tell whether the first
+one is better than the second, instead of always playing a fixed number of
+games.
+
+Usage:
+  python Connect4Match.py PLAYER_A PLAYER_B [options]
+
+where the players are descriptions like "minimax:5:100" or "monty:100"
+(see make_player() in final_players.py). The test is between the
+hypotheses that PLAYER_A is --elo0 Elo stronger than PLAYER_B (by default
+0, i.e. no better) and that it's --elo1 Elo stronger.
+'''
+
+import sys
+import math
+import random
+import argparse
+from final_board import *
+from final_players import *
+from Connect4Sim import Connect4Sim
+
+
+def expected_score(elo):
+    """Returns the expected score per game of a player 'elo' Elo stronger."""
+
+    return 1.0 / (1.0 + 10.0 ** (-elo / 400.0))
+
+
+class SPRT:
+    """
+    Keeps the win/draw/loss count of a match and decides when there's
+    enough evidence to stop it. Uses the usual normal approximation to the
+    log-likelihood ratio of the score per game (a win is 1, a draw 1/2).
+    """
+
+    def __init__(self, elo0=0.0, elo1=50.0, alpha=0.05, beta=0.05):
+        """
+        Attributes:
+            elo0, elo1: the Elo differences of the two hypotheses
+            alpha: the chance of deciding elo1 when elo0 is true
+            beta: the chance of deciding elo0 when elo1 is true
+            lower, upper: the log-likelihood ratios at which the match stops
+            wins, draws, losses: from the first player's point of view
+        """
+
+        assert elo0 < elo1
+        assert 0 < alpha < 1 and 0 < beta < 1
+        self.elo0 = elo0
+        self.elo1 = elo1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+
+    def update(self, result):
+        """Counts one game: 1 for a win, 0 for a draw, -1 for a loss."""
+
+        if result == 1:
+            self.wins += 1
+        elif result == -1:
+            self.losses += 1
+        else:
+            self.draws += 1
+
+    def games(self):
+        """Returns the number of games counted."""
+
+        return self.wins + self.draws + self.losses
+
+    def llr(self):
+        """Returns the log-likelihood ratio of elo1 against elo0."""
+
+        n = self.games()
+        if n == 0:
+            return 0.0
+
+        # with nothing but one kind of result there's no variance to go on,
+        # so a pretend draw is added to give a lopsided match some, or with
+        # nothing but draws, a pretend win and loss
+        wins, draws, losses = self.wins, self.draws, self.losses
+        if draws == n:
+            wins += 1
+            losses += 1
+            n += 2
+        elif max(wins, losses) == n:
+            draws += 1
+            n += 1
+
+        w = float(wins) / n
+        d = float(draws) / n
+        l = float(losses) / n
+        score = w + d / 2
+        var = w * (1 - score) ** 2 + d * (0.5 - score) ** 2 + l * score ** 2
+        s0 = expected_score(self.elo0)
+        s1 = expected_score(self.elo1)
+        return n * (s1 - s0) * (2 * score - s0 - s1) / (2 * var)
+
+    def status(self):
+        """
+        Returns "H1" if the first player has been shown to be elo1 better,
+        "H0" if it has been shown not to be, and None if it's too early to
+        tell.
+        """
+
+        llr = self.llr()
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+
+def match(spec_a, spec_b, sprt, max_games, seed=None):
+    """
+    Plays games between two players until the SPRT decides or max_games
+    have been played. The players take turns to go first.
+    Arguments:
+        spec_a, spec_b: descriptions of the two players
+        sprt: the SPRT to count the games with
+        max_games: the most games to play
+        seed: if given, seeds the random number generator
+    Returns the SPRT's status at the end.
+    """
+
+    if seed is not None:
+        random.seed(seed)
+    player_a = make_player(spec_a, 1)
+    player_b = make_player(spec_b, 2)
+    while sprt.games() < max_games:
+        toMove = sprt.games() % 2 + 1
+        winner = Connect4Sim(player_a, player_b, toMove).play()
+        if winner == 1:
+            sprt.update(1)
+        elif winner == 2:
+            sprt.update(-1)
+        else:
+            sprt.update(0)
+        print "game %d: +%d =%d -%d, LLR %.2f (%.2f, %.2f)" % (sprt.games(),
+            sprt.wins, sprt.draws, sprt.losses, sprt.llr(), sprt.lower,
+            sprt.upper)
+        sys.stdout.flush()
+        if sprt.status() is not None:
+            break
+
+    # lets players save anything they keep between runs
+    for player in [player_a, player_b]:
+        if hasattr(player, "close"):
+            player.close()
+    return sprt.status()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Play two players until an SPRT decides between them.")
+    parser.add_argument("player_a")
+    parser.add_argument("player_b")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=50.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--max-games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=None)
+    options = parser.parse_args()
+
+    sprt = SPRT(options.elo0, options.elo1, options.alpha, options.beta)
+    status = match(options.player_a, options.player_b, sprt,
+        options.max_games, options.seed)
+    if status == "H1":
+        print "%s is better than %s" % (options.player_a, options.player_b)
+    elif status == "H0":
+        print "%s is not better than %s" % (options.player_a, options.player_b)
+    else:
+        print "no decision after %d games" % sprt.games()
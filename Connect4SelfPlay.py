@@ -0,0 +1,250 @@
+'''
+Connect4SelfPlay.py
+
+This module plays pairs of computer players against each other across
+several worker processes, samples positions from each game and writes them
+to disk, labelled with the result of the game, in chunk files.
+
+Usage:
+  python Connect4SelfPlay.py OUT_DIR GAMES PLAYER1 PLAYER2 [options]
+
+where PLAYER1 and PLAYER2 are player descriptions like "minimax:5:100" or
+"monty:100" (see make_player() in final_players.py). Running the same
+command again picks up where the last run stopped.
+'''
+
+import os
+import sys
+import random
+import argparse
+import multiprocessing
+from final_board import *
+from final_players import *
+from Connect4Sim import Connect4Sim
+
+PROGRESS_FILE = "progress.txt"
+CHUNK_PREFIX = "positions_"
+
+
+def play_game(args):
+    """
+    Plays a single game and samples positions from it. This is what the
+    worker processes run, so it has to live at the top level of the module.
+    Arguments:
+        args: a tuple (index, spec1, spec2, seed, sample) where index is the
+        number of the game, spec1 and spec2 describe the players, seed seeds
+        the random number generator and sample is the chance of any given
+        position being kept
+    Returns (index, winner, records), where winner is 0 for a draw and
+    records is a list of (key, to_move, ply, move, outcome) tuples.
+    """
+
+    index, spec1, spec2, seed, sample = args
+
+    # seeding per game makes every game reproducible, which is what lets a
+    # resumed run replay exactly the games that were lost
+    random.seed(seed)
+    player1 = make_player(spec1, 1)
+    player2 = make_player(spec2, 2)
+    toMove = random.choice([1, 2])
+    game = Connect4Sim(player1, player2, toMove)
+    winner = game.play()
+
+    # replays the game on a fresh board, keeping some of the positions along
+    # the way; the outcome is from the point of view of the player to move,
+    # so 1 is a win, 0 a draw and -1 a loss
+    records = []
+    board = Connect4Board()
+    cols = board.getCols()
+    for ply, (player, col) in enumerate(game.moves):
+        if random.random() < sample:
+            key = board.getKey()
+            canonical = board.getCanonicalKey()
+            move = col
+
+            # if the canonical key is the mirror image, so is the move
+            if canonical != key:
+                move = cols - 1 - col
+
+            if winner == 0:
+                outcome = 0
+            elif winner == player:
+                outcome = 1
+            else:
+                outcome = -1
+            records.append((canonical, player, ply, move, outcome))
+        board.makeMove(col, player)
+
+    return (index, winner, records)
+
+
+class ChunkWriter:
+    """
+    Collects sampled positions, throws away ones that have been seen before
+    and writes the rest to numbered chunk files in a directory. It also keeps
+    track of how many games have been written out, so that a run can be
+    resumed.
+    """
+
+    def __init__(self, directory, chunk_size):
+        """
+        Attributes:
+            directory: where the chunk files and the progress file go
+            chunk_size: how many positions to collect before writing a chunk
+            seen: the set of position keys that have already been kept
+            buffer: positions that have been kept but not written yet
+            chunks: how many chunk files have been written
+            games: how many games have all their positions written to disk
+        """
+
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.seen = set()
+        self.buffer = []
+        self.chunks = 0
+        self.games = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.load()
+
+    def load(self):
+        """
+        Reads back the progress file and the chunks from an earlier run, if
+        there was one.
+        """
+
+        path = os.path.join(self.directory, PROGRESS_FILE)
+        if not os.path.exists(path):
+            return
+        f = open(path)
+        self.games, self.chunks = [int(v) for v in f.read().split()]
+        f.close()
+
+        for i in range(self.chunks):
+            f = open(self.chunk_path(i))
+            for line in f:
+                self.seen.add(line.split()[0])
+            f.close()
+
+    def chunk_path(self, i):
+        """Returns the path of the i-th chunk file."""
+
+        return os.path.join(self.directory, "%s%05d.txt" % (CHUNK_PREFIX, i))
+
+    def add(self, records):
+        """
+        Adds the positions from one game, skipping those already seen.
+        Returns how many of them were new.
+        """
+
+        new = 0
+        for record in records:
+            if record[0] not in self.seen:
+                self.seen.add(record[0])
+                self.buffer.append(record)
+                new += 1
+        return new
+
+    def finish_game(self):
+        """
+        Marks one more game as done, and writes a chunk if enough positions
+        have built up.
+        """
+
+        self.games += 1
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes everything in the buffer to a new chunk file and then records
+        the progress. The chunk is written to a temporary file and renamed, so
+        an interrupted run never leaves half a chunk behind.
+        """
+
+        if self.buffer:
+            path = self.chunk_path(self.chunks)
+            f = open(path + ".tmp", "w")
+            for record in self.buffer:
+                f.write("%s %d %d %d %d\n" % record)
+            f.close()
+            os.rename(path + ".tmp", path)
+            self.chunks += 1
+            self.buffer = []
+
+        # the progress only ever counts games whose positions are on disk
+        path = os.path.join(self.directory, PROGRESS_FILE)
+        f = open(path + ".tmp", "w")
+        f.write("%d %d\n" % (self.games, self.chunks))
+        f.close()
+        os.rename(path + ".tmp", path)
+
+
+def self_play(directory, games, spec1, spec2, workers=None, sample=0.25,
+    chunk_size=10000, seed=0):
+    """
+    Plays games between two players across a pool of worker processes and
+    streams the sampled positions to disk.
+    Arguments:
+        directory: where to write the chunks
+        games: the total number of games to play, including any played by an
+        earlier run into the same directory
+        spec1, spec2: descriptions of player 1 and player 2
+        workers: how many processes to use; defaults to one per CPU
+        sample: the chance of any given position being kept
+        chunk_size: how many positions go in each chunk file
+        seed: the seed of the first game; game i uses seed + i
+    Returns the ChunkWriter, which has the final counts.
+    """
+
+    writer = ChunkWriter(directory, chunk_size)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(workers)
+
+    # only a couple of games per worker are allowed to be waiting at once;
+    # if writing to disk falls behind, this stops new games being handed
+    # out instead of piling finished ones up in memory
+    max_pending = 2 * workers
+    pending = []
+    start = writer.games
+    next_game = start
+    try:
+        while next_game < games or pending:
+            while next_game < games and len(pending) < max_pending:
+                args = (next_game, spec1, spec2, seed + next_game, sample)
+                pending.append(pool.apply_async(play_game, (args,)))
+                next_game += 1
+
+            # waits on the oldest game so that games are finished in order,
+            # which keeps the progress count meaningful
+            index, winner, records = pending.pop(0).get()
+            new = writer.add(records)
+            writer.finish_game()
+            print "game %d: winner %d, %d new positions" % (index, winner, new)
+        writer.flush()
+    finally:
+        pool.terminate()
+        pool.join()
+    return writer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Generate positions labelled with game results.")
+    parser.add_argument("directory")
+    parser.add_argument("games", type=int)
+    parser.add_argument("player1")
+    parser.add_argument("player2")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sample", type=float, default=0.25)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+
+    writer = self_play(options.directory, options.games, options.player1,
+        options.player2, options.workers, options.sample, options.chunk_size,
+        options.seed)
+    print "%d games, %d positions in %d chunks" % (writer.games,
+        len(writer.seen), writer.chunks)
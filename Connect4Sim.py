@@ -2,22 +2,26 @@ import sys
 from final_board import *
 from final_players import *
 import random
+from final_latency import *
 
 class Connect4Sim:
     '''Instances of this class simulate an interactive Connect-4 game.'''
 
-    def __init__(self, player1, opponent, toMove):
+    def __init__(self, player1, opponent, toMove, latency=None):
         '''
         Initializes the game.
 
         Arguments:
           opponent -- the computer opponent object
           toMove   -- the first player to move.  1 = human, 2 = computer.
+          latency  -- if given, a LatencyRecorder to record how long each
+                      player takes over each move
         '''
         assert toMove in [1, 2]
         self.toMove = toMove
         self.player1 = player1
         self.opponent = opponent
+        self.latency = latency
         self.board = Connect4Board()
         self.nrows = self.board.getRows()
         self.ncols = self.board.getCols()
@@ -70,6 +74,17 @@ class Connect4Sim:
         else:
             raise MoveError('Not enough moves to undo!')
 
+    def ask(self, player, toMove):
+        '''
+        Ask a player for its move (on a copy of the board), timing it if
+        there's a LatencyRecorder.
+        '''
+
+        if self.latency is None:
+            return player.chooseMove(self.board.clone(), toMove)
+        name = '%s %d' % (player.__class__.__name__, toMove)
+        return self.latency.time_move(name, player, self.board.clone(), toMove)
+
     def changePlayerToMove(self):
         '''Change the player to move.'''
 
@@ -88,12 +103,12 @@ class Connect4Sim:
         while True:
             try:
                 if self.toMove == 1:  # player 1 = human
-                    col = self.player1.chooseMove(self.board.clone(), 1)
+                    col = self.ask(self.player1, 1)
                     self.makeMove(col, 1)
                     # print 'SimplePlayer plays on column %d...' % col
                     # self.show()
                 else:  # player 2 = computer
-                    col = self.opponent.chooseMove(self.board.clone(), 2)
+                    col = self.ask(self.opponent, 2)
                     self.makeMove(col, 2)
                     # print 'Minimax plays on column %d...' % col
                     # self.show()
@@ -128,9 +143,13 @@ if __name__ == '__main__':
     # assert depth > 0
     # opponent = Minimax(1, depth)
     opponent = Monty(100, 2)
-    player1 = Minimax(1, 5, 100)
+
+    # the openings come up again and again, so Minimax remembers its moves
+    cache = DecisionCache()
+    player1 = Minimax(1, 5, 100, cache=cache)
 
     n = int(raw_input("Enter number of simulations: "))
+    latency = LatencyRecorder()
 
     simple = 0
     minimax = 0
@@ -141,7 +160,7 @@ if __name__ == '__main__':
         # print
         # print 'First player to move: %d' % toMove
         # print
-        game = Connect4Sim(player1, opponent, toMove)
+        game = Connect4Sim(player1, opponent, toMove, latency)
         result = game.play()
         if result == 2:
             simple += 1
@@ -149,4 +168,6 @@ if __name__ == '__main__':
             minimax += 1
         else:
             draw += 1
-    print simple, minimax, draw
\ No newline at end of file
+    print simple, minimax, draw
+    latency.report()
+    cache.report()
\ No newline at end of file
@@ -7,13 +7,89 @@ players.
 
 import random
 
+class Adjudicator:
+    '''
+    This decides simulated games early, when it's already clear how they
+    will end, so that the simulator doesn't have to play them out.
+    '''
+
+    def __init__(self, threats=True, max_plies=None, evaluator=None,
+        solved=None):
+        '''
+        Arguments:
+          threats   -- if True, end the game when the player who just moved
+                       has two or more ways to win next move, since only one
+                       can be blocked, unless the player to move can win
+                       straight away, in which case they do. That's certain
+                       with players like BetterPlayer, which always take a
+                       win and always block.
+          max_plies -- if given, end the game once this many moves have been
+                       simulated: with the evaluator's score for the player
+                       to move as the chance of winning (from -1 for a sure
+                       loss to 1 for a sure win), or as a draw if there's no
+                       evaluator
+          evaluator -- anything with an evaluate(board, player) method, like
+                       NTupleEvaluator
+          solved    -- a dictionary (or anything with get()) mapping
+                       board.getCanonicalKey() + str(player to move) to the
+                       known value of the position for the player to move:
+                       1 for a win, 0 for a draw and -1 for a loss
+        '''
+
+        self.threats = threats
+        self.max_plies = max_plies
+        self.evaluator = evaluator
+        self.solved = solved
+
+    def judge(self, board, toMove, plies):
+        '''
+        Decide the game if possible.
+
+        Arguments:
+          board  -- the current board state
+          toMove -- the next player to move (1 or 2)
+          plies  -- how many moves have been simulated so far
+
+        Return value: None if the game has to go on, otherwise the result in
+        the same form as Connect4Simulator.simulate().
+        '''
+
+        other = 3 - toMove
+        if self.solved is not None:
+            value = self.solved.get(board.getCanonicalKey() + str(toMove))
+            if value is not None:
+                if value > 0:
+                    return toMove
+                elif value < 0:
+                    return other
+                return 0
+
+        # the player who just moved needs at least three pieces on the board
+        # to have any threats at all
+        if self.threats and plies >= 5:
+            if len(board.winningMoves(other)) >= 2:
+                if board.winningMoves(toMove):
+                    return toMove
+                return other
+
+        if self.max_plies is not None and plies >= self.max_plies:
+            if self.evaluator is None:
+                return 0
+            score = self.evaluator.evaluate(board, toMove)
+            if random.random() < (1 + score) / 2.0:
+                return toMove
+            return other
+
+        return None
+
 class Connect4Simulator:
     '''
     This simulates a Connect-4 game with two computer players starting from a 
     particular board state.
     '''
 
-    def __init__(self, board, player1, player2, toMove):
+    def __init__(self, board, player1, player2, toMove, latency=None,
+        adjudicator=None):
         '''
         Initialize the simulator.  
 
@@ -22,6 +98,9 @@ class Connect4Simulator:
           player1 -- the player who is player 1
           player2 -- the player who is player 2
           toMove  -- the next player to move (1 or 2)
+          latency -- if given, a LatencyRecorder (see final_latency.py) to
+                     record how long each player takes over each move
+          adjudicator -- if given, an Adjudicator to end games early
         '''
 
         assert toMove in [1, 2]
@@ -29,6 +108,9 @@ class Connect4Simulator:
         self.player1 = player1
         self.player2 = player2
         self.toMove  = toMove
+        self.moves   = []   # (player, column) for each move simulated
+        self.latency = latency
+        self.adjudicator = adjudicator
 
     def simulate(self):
         '''
@@ -44,12 +126,26 @@ class Connect4Simulator:
             return 0
 
         while True:
+            if self.adjudicator is not None:
+               result = self.adjudicator.judge(self.board, self.toMove,
+                  len(self.moves))
+               if result is not None:
+                  return result
+
             if self.toMove == 1:
-               move = self.player1.chooseMove(self.board, 1)
+               player = self.player1
+            else:
+               player = self.player2
+
+            if self.latency is None:
+               move = player.chooseMove(self.board, self.toMove)
             else:
-               move = self.player2.chooseMove(self.board, 2)
+               name = '%s %d' % (player.__class__.__name__, self.toMove)
+               move = self.latency.time_move(name, player, self.board,
+                  self.toMove)
 
             self.board.makeMove(move, self.toMove)
+            self.moves.append((self.toMove, move))
             if self.board.isWin(move):
                 return self.toMove
             elif self.board.isDraw():
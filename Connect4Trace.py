@@ -0,0 +1,42 @@
+'''
+Connect4Trace.py
+
+This module prints the search trees written by Minimax's trace option (see
+final_trace.py), or just a subtree of them, without reading the whole file
+into memory.
+
+Usage:
+  python Connect4Trace.py TRACE_FILE [--prefix COLUMNS] [--plies N]
+                                     [--key BOARD_KEY]
+
+e.g. "--prefix 33 --plies 1" shows the position after two moves in column 3
+and every move from it. Each position is indented by how far below the
+prefix it is, and its children are printed before it, as they were
+searched.
+'''
+
+import argparse
+from final_trace import *
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Print a subtree of a Minimax search trace.")
+    parser.add_argument("trace")
+    parser.add_argument("--prefix", default="")
+    parser.add_argument("--plies", type=int, default=None)
+    parser.add_argument("--key", default=None)
+    options = parser.parse_args()
+
+    last = None
+    count = 0
+    for search, path, value, depth, bound in read_tree(options.trace,
+        options.prefix, options.plies, options.key):
+        if search != last:
+            print "search from %s, player %d to move, depth %d" % search
+            last = search
+        indent = "  " * (len(path) - len(options.prefix))
+        print "%s%s %s%d (depth %d)" % (indent, path or "-", bound, value,
+            depth)
+        count += 1
+    print "%d positions" % count
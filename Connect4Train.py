@@ -0,0 +1,48 @@
+'''
+Connect4Train.py
+
+This module trains the weights of the n-tuple evaluator (see
+final_ntuple.py) from the positions written by Connect4SelfPlay.py.
+Much faster with NumPy, but works without it.
+
+Usage:
+  python Connect4Train.py DATA_DIR WEIGHTS_FILE [options]
+
+If WEIGHTS_FILE already exists, training carries on from its weights.
+Minimax uses the weights if given evaluator=WEIGHTS_FILE, e.g. as the
+player "minimax:6:250:evaluator=weights.bin".
+'''
+
+import os
+import sys
+import argparse
+from final_ntuple import *
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Train the n-tuple evaluator from self-play positions.")
+    parser.add_argument("directory")
+    parser.add_argument("weights")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=1.0)
+    parser.add_argument("--batch", type=int, default=256)
+    options = parser.parse_args()
+
+    if numpy is None:
+        print >> sys.stderr, 'NumPy not found; training without it, slowly.'
+
+    evaluator = NTupleEvaluator()
+    if os.path.exists(options.weights):
+        evaluator.load(options.weights)
+
+    positions = load_positions(options.directory)
+    print "%d positions, %d weights" % (len(positions), evaluator.size)
+
+    def report(epoch, error):
+        print "epoch %d: mean squared error %.4f" % (epoch, error)
+        sys.stdout.flush()
+
+    train(positions, evaluator, options.epochs, options.rate, options.batch,
+        report)
+    evaluator.save(options.weights)
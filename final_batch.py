@@ -0,0 +1,178 @@
+'''
+final_batch.py
+
+This module contains a search that scores the positions at the bottom of
+the tree all at once, in batches, instead of one at a time as it reaches
+them. That lets the evaluator do a whole batch in one go (one NumPy call
+for the n-tuple evaluator) instead of paying Python's overhead per position.
+'''
+
+# scores from an evaluator are kept strictly between these, so that 1 and
+# -1 always mean a proven win or loss
+HIGHEST_GUESS = 0.999
+LOWEST_GUESS = -0.999
+
+
+class BatchedSearch:
+    """
+    Searches in three passes: first it builds the tree down to the given
+    depth, collecting the positions at the bottom (each only once, however
+    many ways it can be reached); then it scores them in batches; then it
+    takes the scores back up the tree with negamax.
+
+    Wins, losses and full boards are handled exactly as in Minimax.Tree, so
+    moves that score 1 or -1 are the tree's wins and losses; everything in
+    between is the evaluator's guess. Unlike the tree, it stops expanding a
+    position as soon as its value is proven, and only the positions at the
+    bottom of what's left are scored, since the evaluator is the expensive
+    part.
+    """
+
+    def __init__(self, evaluator, batch=4096):
+        """
+        Attributes:
+            evaluator: anything with an evaluate_batch() method that takes a
+            list of (board key, player to move) and returns a list of scores
+            between -1 and 1 for the player to move
+            batch: how many positions to hand the evaluator at a time
+            leaves: maps each position at the bottom of the tree to its
+            index in the list given to the evaluator
+            expanded: how many positions the last search expanded
+            scores: the score of each move from the last search
+        """
+
+        assert batch > 0
+        self.evaluator = evaluator
+        self.batch = batch
+        self.leaves = {}
+        self.scores = {}
+        self.expanded = 0
+
+    def move_scores(self, board, player, depth):
+        """
+        Returns a dictionary mapping each move 'player' can make on 'board' to
+        its score, searched to 'depth' levels.
+        """
+
+        self.leaves = {}
+        self.expanded = 0
+        player2 = player % 2 + 1
+        plans = []
+        for move in board.possibleMoves():
+            if board.isWinningMove(move, player):
+                plans.append((move, ("value", -1)))
+                continue
+            board.makeMove(move, player)
+            plans.append((move, self.expand(board, player2, depth - 1)))
+            board.unmakeMove(move)
+
+        # the leaves are only numbered now, so that none under a position
+        # that turned out to be proven get scored
+        for move, plan in plans:
+            self.collect(plan)
+
+        # scores every position at the bottom of the tree, a batch at a time
+        positions = [None] * len(self.leaves)
+        for position, i in self.leaves.items():
+            positions[i] = position
+        values = []
+        for start in range(0, len(positions), self.batch):
+            scores = self.evaluator.evaluate_batch(
+                positions[start:start + self.batch])
+            values.extend([min(HIGHEST_GUESS, max(LOWEST_GUESS, s))
+                for s in scores])
+
+        # the plans are from the point of view of the player to move in the
+        # position after the move, so they're negated for the root
+        self.scores = {}
+        for move, plan in plans:
+            self.scores[move] = -self.back_up(plan, values)
+        return self.scores
+
+    def move_table(self, board, player, depth):
+        """
+        Returns the same kind of dictionary of win/loss/indeterminate moves
+        as Minimax.Tree.move_table(), stopping at the first winning move like
+        the tree does. The scores are left in self.scores.
+        """
+
+        scores = self.move_scores(board, player, depth)
+        result = {-1:[], 0:[], 1:[]}
+        for move in board.possibleMoves():
+            if scores[move] >= 1:
+                result[1].append(move)
+                break
+            elif scores[move] <= -1:
+                result[-1].append(move)
+            else:
+                result[0].append(move)
+        return result
+
+    def expand(self, board, player, depth):
+        """
+        Builds the plan for the position on 'board' with 'player' to move:
+        ("value", v) if its value is already known, ("leaf", position) if
+        it's to be scored by the evaluator, or ("node", plans) for the plans
+        of each move. Values are for 'player'.
+        """
+
+        # same order of checks as subtree_maker()
+        self.expanded += 1
+        moves = board.possibleMoves()
+        if moves == []:
+            return ("value", -1)
+
+        if depth == 0:
+            return ("leaf", (board.getCanonicalKey(), player))
+
+        for move in moves:
+            if board.isWinningMove(move, player):
+                return ("value", 1)
+
+        # a threat has to be blocked, as any other move loses next turn, and
+        # two can't be; that's only what the tree finds if the other
+        # player's win is inside the depth, so not just above the bottom
+        player2 = player % 2 + 1
+        if depth >= 2:
+            threats = board.winningMoves(player2)
+            if len(threats) > 1:
+                return ("value", -1)
+            if threats:
+                moves = threats
+
+        # one move that wins is enough, and if every move loses (the ones
+        # left out above lose anyway), so does the position
+        plans = []
+        for move in moves:
+            board.makeMove(move, player)
+            plan = self.expand(board, player2, depth - 1)
+            board.unmakeMove(move)
+            if plan == ("value", -1):
+                return ("value", 1)
+            plans.append(plan)
+        if plans == [("value", 1)] * len(plans):
+            return ("value", -1)
+        return ("node", plans)
+
+    def collect(self, plan):
+        """
+        Numbers the positions at the bottom of a plan for the evaluator,
+        each only once, however many ways it can be reached.
+        """
+
+        kind, content = plan
+        if kind == "node":
+            for child in content:
+                self.collect(child)
+        elif kind == "leaf" and content not in self.leaves:
+            self.leaves[content] = len(self.leaves)
+
+    def back_up(self, plan, values):
+        """Returns the negamax value of a plan, given the leaves' scores."""
+
+        kind, content = plan
+        if kind == "value":
+            return content
+        if kind == "leaf":
+            return values[self.leaves[content]]
+        return max([-self.back_up(child, values) for child in content])
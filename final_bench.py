@@ -0,0 +1,318 @@
+'''
+final_bench.py
+
+This module contains a benchmark: a corpus of positions whose right answers
+are known for certain, and a harness that runs players on them and reports
+how often they get them right, how much work they do and how long they take.
+
+There are two kinds of position in the corpus:
+  win  -- the player to move can force a win within a given number of moves
+          (counting both players'); the right answers are the moves that
+          keep a win within that many, so, like a "mate in n" puzzle, a move
+          that wins more slowly counts as wrong. These are found with
+          NullWindowSearch, and come from every phase of the game.
+  exact -- an endgame solved all the way to the end, with draws as draws;
+          the right answers are the moves that keep the position's value.
+          Half are wins and half draws (a lost position is never used, as
+          every move keeps its value, so there's no wrong answer).
+
+Positions are stored one to a line:
+  KEY PLAYER PHASE KIND VALUE PLIES ANSWERS
+with ANSWERS the right columns as a string of digits, and PLIES the limit
+for a "win" position (and the number of empty squares for an "exact" one).
+'''
+
+import time
+import random
+from final_board import *
+from final_search import *
+from final_latency import phase
+
+# how many empty squares an endgame can have and still be solved exactly in
+# a reasonable time
+SOLVE_EMPTY = 12
+
+
+class Solver:
+    """
+    Solves positions exactly, to the end of the game: 1 if the player to
+    move wins, 0 if it's a draw and -1 if they lose. Unlike the searches
+    Minimax uses, a full board is a draw here.
+    """
+
+    def __init__(self):
+        """
+        Attributes:
+            table: maps position keys to (lower, upper) bounds on their
+            values
+            nodes: how many positions have been visited
+        """
+
+        self.table = {}
+        self.nodes = 0
+
+    def value(self, board, player):
+        """Returns the exact value of the position for 'player' to move."""
+
+        return self.search(board, player, -1, 1)
+
+    def search(self, board, player, alpha, beta):
+        """
+        Alpha-beta search to the end of the game, in negamax form, with the
+        usual fail-soft bounds (see NullWindowSearch.search()).
+        """
+
+        self.nodes += 1
+        moves = board.possibleMoves()
+        if moves == []:
+            return 0
+        if board.winningMoves(player):
+            return 1
+
+        # a threat has to be blocked, and two can't be
+        player2 = player % 2 + 1
+        threats = board.winningMoves(player2)
+        if len(threats) > 1:
+            return -1
+        if threats:
+            moves = threats
+
+        key = board.getCanonicalKey() + str(player)
+        entry = self.table.get(key)
+        if entry is not None:
+            lower, upper = entry
+            if lower >= beta:
+                return lower
+            if upper <= alpha:
+                return upper
+            if lower == upper:
+                return lower
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+
+        center = board.getCols() // 2
+        moves.sort(key=lambda m: abs(m - center))
+        best = -1
+        a = alpha
+        for move in moves:
+            board.makeMove(move, player)
+            score = -self.search(board, player2, -beta, -a)
+            board.unmakeMove(move)
+            if score > best:
+                best = score
+            if best > a:
+                a = best
+            if a >= beta:
+                break
+
+        if best <= alpha:
+            self.table[key] = (-1, best)
+        elif best >= beta:
+            self.table[key] = (best, 1)
+        else:
+            self.table[key] = (best, best)
+        return best
+
+
+def random_position(plies, noise=0.5):
+    """
+    Returns (board, player to move) after a game played for 'plies' moves
+    by a player that wins and blocks when it can and otherwise moves at
+    random, except that 'noise' of the time it moves at random regardless,
+    so that the positions aren't all balanced. Returns None if the game
+    ended before then.
+    """
+
+    board = Connect4Board()
+    player = 1
+    for i in range(plies):
+        moves = board.possibleMoves()
+        move = random.choice(moves)
+        if random.random() >= noise:
+            wins = board.winningMoves(player)
+            blocks = board.winningMoves(player % 2 + 1)
+            if wins:
+                move = wins[0]
+            elif blocks:
+                move = blocks[0]
+        board.makeMove(move, player)
+        if board.isWin(move) or board.isDraw():
+            return None
+        player = player % 2 + 1
+    return (board, player)
+
+
+def win_entry(board, player, max_plies):
+    """
+    Returns the corpus entry for a "win" position, if 'player' can force a
+    win on 'board' in at least 3 and at most 'max_plies' moves, and None
+    otherwise.
+    """
+
+    # the searches count a full board as a win for whoever filled it, so
+    # they're only trusted when the board can't fill up within the limit
+    empty = board.getKey().count("0")
+    if board.winningMoves(player):
+        return None
+    search = NullWindowSearch("pvs")
+    for plies in range(3, min(max_plies, empty - 1) + 1, 2):
+        if search.value(board, player, plies) != 1:
+            continue
+        answers = []
+        for move in board.possibleMoves():
+            board.makeMove(move, player)
+            if search.value(board, player % 2 + 1, plies - 1) == -1:
+                answers.append(move)
+            board.unmakeMove(move)
+        return (board.getKey(), player, phase(board), "win", 1, plies,
+            answers)
+    return None
+
+
+def exact_entry(board, player, solver):
+    """
+    Returns the corpus entry for an endgame solved exactly, or None if it
+    isn't worth having (every move is as good as any other).
+    """
+
+    value = solver.value(board, player)
+    answers = []
+    moves = board.possibleMoves()
+    for move in moves:
+        if board.isWinningMove(move, player):
+            answers.append(move)
+            continue
+        board.makeMove(move, player)
+        if -solver.value(board, player % 2 + 1) == value:
+            answers.append(move)
+        board.unmakeMove(move)
+    if len(answers) == len(moves):
+        return None
+    return (board.getKey(), player, phase(board), "exact", value,
+        board.getKey().count("0"), answers)
+
+
+def make_corpus(count, max_plies=11, report=None):
+    """
+    Makes a corpus of 'count' positions, about a third from each phase of
+    the game: "win" positions for the opening and middlegame, and half
+    "win" and half "exact" for the endgame. 'report', if given, is called
+    with each entry as it's found.
+    """
+
+    solver = Solver()
+    wanted = {"opening": count // 3, "middlegame": count // 3}
+    wanted["endgame"] = count - wanted["opening"] - wanted["middlegame"]
+    exact_wanted = wanted["endgame"] // 2
+
+    # won endgames come up far more often than drawn ones, so each gets
+    # half of the exact positions
+    values_wanted = {0: exact_wanted // 2}
+    values_wanted[1] = exact_wanted - values_wanted[0]
+    plies_range = {"opening": (6, 13), "middlegame": (14, 27),
+        "endgame": (28, 40)}
+    corpus = []
+    seen = set()
+    for name in ["opening", "middlegame", "endgame"]:
+        low, high = plies_range[name]
+        while wanted[name] > 0:
+            found = random_position(random.randint(low, high))
+            if found is None:
+                continue
+            board, player = found
+            if board.getCanonicalKey() + str(player) in seen:
+                continue
+            entry = None
+            if name == "endgame" and exact_wanted > 0 and \
+                board.getKey().count("0") <= SOLVE_EMPTY:
+                entry = exact_entry(board, player, solver)
+                if entry is not None and values_wanted[entry[4]] == 0:
+                    entry = None
+                if entry is not None:
+                    values_wanted[entry[4]] -= 1
+                    exact_wanted -= 1
+            elif name != "endgame" or exact_wanted < wanted[name]:
+                entry = win_entry(board, player, max_plies)
+            if entry is None:
+                continue
+            seen.add(board.getCanonicalKey() + str(player))
+            corpus.append(entry)
+            wanted[name] -= 1
+            if report is not None:
+                report(entry)
+    return corpus
+
+
+def save_corpus(corpus, path):
+    """Writes a corpus to a file."""
+
+    f = open(path, "w")
+    for key, player, phase_name, kind, value, plies, answers in corpus:
+        f.write("%s %d %s %s %d %d %s\n" % (key, player, phase_name, kind,
+            value, plies, "".join([str(m) for m in answers])))
+    f.close()
+
+
+def load_corpus(path):
+    """Reads a corpus written by save_corpus()."""
+
+    corpus = []
+    f = open(path)
+    for line in f:
+        fields = line.split()
+        if not fields or fields[0].startswith("#"):
+            continue
+        corpus.append((fields[0], int(fields[1]), fields[2], fields[3],
+            int(fields[4]), int(fields[5]), [int(m) for m in fields[6]]))
+    f.close()
+    return corpus
+
+
+def work(player):
+    """
+    Returns how much work a player did on its last move, and what it
+    counts: positions searched for Minimax, games simulated for Monty and
+    Mcts, or (None, None) if the player doesn't say.
+    """
+
+    if hasattr(player, "nodes"):
+        return (player.nodes, "nodes")
+    if hasattr(player, "simulations"):
+        return (player.simulations, "games")
+    return (None, None)
+
+
+def run_bench(player, corpus, report=None):
+    """
+    Runs a player on every position of a corpus.
+    Arguments:
+        player: anything with a chooseMove(board, player) method
+        corpus: a list of entries from load_corpus() or make_corpus()
+        report: if given, called as report(entry, move, right, seconds,
+        work) after each position
+    Returns a dictionary mapping each phase, and "all", to [positions,
+    right answers, total work, total seconds, total seconds for the right
+    answers].
+    """
+
+    totals = {}
+    for entry in corpus:
+        key, toMove, phase_name, kind, value, plies, answers = entry
+        board = Connect4Board()
+        board.setKey(key)
+        started = time.time()
+        move = player.chooseMove(board, toMove)
+        seconds = time.time() - started
+        amount, unit = work(player)
+        right = move in answers
+        for name in [phase_name, "all"]:
+            counts = totals.setdefault(name, [0, 0, 0, 0.0, 0.0])
+            counts[0] += 1
+            counts[1] += int(right)
+            counts[2] += amount or 0
+            counts[3] += seconds
+            if right:
+                counts[4] += seconds
+        if report is not None:
+            report(entry, move, right, seconds, amount)
+    return totals
@@ -113,6 +113,44 @@ class Connect4Board:
         clone.rows = len(self.board[0])
         return clone
 
+    def getKey(self):
+        '''
+        Return a string that identifies the position on the board: one digit
+        per square, column by column from the bottom up.
+        '''
+
+        return ''.join([str(v) for col in self.board for v in col])
+
+    def getCanonicalKey(self):
+        '''
+        Return the key of the position or of its mirror image, whichever is
+        smaller, so that mirrored positions share a key.
+        '''
+
+        # a mirrored position is just the columns in reverse order, and it's
+        # worth exactly the same as the original
+        key = self.getKey()
+        mirror = ''.join([str(v) for col in reversed(self.board) for v in col])
+        return min(key, mirror)
+
+    def setKey(self, key):
+        '''
+        Set the board to the position given by a key from getKey().
+
+        Arguments:
+          key -- a string with one digit (0, 1 or 2) per square
+
+        Return value: none
+
+        Raise a BoardError exception if the key is the wrong size.
+        '''
+
+        if len(key) != self.getCols() * self.getRows():
+            raise BoardError("Invalid board key.")
+        rows = self.getRows()
+        self.board = [[int(v) for v in key[c * rows:(c + 1) * rows]]
+            for c in range(self.getCols())]
+
     def possibleMoves(self):
         '''
         Compute the list of possible moves (i.e. a list of column numbers 
@@ -385,6 +423,27 @@ class Connect4Board:
         board.makeMove(col, player)
         return board.isWin(col)
 
+    def winningMoves(self, player):
+        '''
+        Compute the list of moves that would win the game for the player
+        straight away.  The board state does not change.
+
+        Arguments:
+          player -- either 1 or 2
+
+        Return value: the list of winning moves
+        '''
+
+        # makes and unmakes each move instead of cloning the board, which is
+        # what makes this faster than calling isWinningMove() on every column
+        moves = []
+        for col in self.possibleMoves():
+            self.makeMove(col, player)
+            if self.isWin(col):
+                moves.append(col)
+            self.unmakeMove(col)
+        return moves
+
     def isDrawingMove(self, col, player):
         '''
         Check to see if making the move 'col' by the player 'player'
@@ -0,0 +1,131 @@
+'''
+final_cache.py
+
+This module contains a cache of the moves Minimax has decided on, so that
+positions that come up game after game (the openings, mostly) are only
+searched once. The cache can be kept in a file from one run to the next.
+'''
+
+import os
+import pickle
+from collections import OrderedDict
+
+
+class DecisionCache:
+    """
+    Remembers the move chosen in each position, and its score, for a given
+    player to move and a given set of engine settings. Keeps at most a fixed
+    number of decisions, throwing out the ones that have gone unused the
+    longest.
+
+    Mirrored positions share an entry, with the move mirrored to match.
+    """
+
+    def __init__(self, size=10000, path=None):
+        """
+        Attributes:
+            size: the most decisions to remember
+            path: the file the cache is kept in between runs, if any; it's
+            read now if it exists, and written by save()
+            entries: maps (canonical board key, player, settings) to (move,
+            score), least recently used first; moves are for the canonical
+            board
+            hits, misses: how many lookups found a decision and how many
+            didn't
+        """
+
+        assert size > 0
+        self.size = size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def key(self, board, player, settings):
+        """
+        Returns the key for a position and whether the board is the mirror
+        image of the canonical one.
+        """
+
+        canonical = board.getCanonicalKey()
+        return (canonical, player, settings), canonical != board.getKey()
+
+    def lookup(self, board, player, settings):
+        """
+        Returns the (move, score) remembered for 'player' to move on 'board'
+        with these settings, or None if there isn't one.
+        """
+
+        key, mirrored = self.key(board, player, settings)
+
+        # popping and putting back moves the entry to the recent end
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries[key] = entry
+        self.hits += 1
+
+        move, score = entry
+        if mirrored:
+            move = board.getCols() - 1 - move
+        return (move, score)
+
+    def store(self, board, player, settings, move, score):
+        """Remembers that 'player' chose 'move', with 'score', on 'board'."""
+
+        key, mirrored = self.key(board, player, settings)
+        if mirrored:
+            move = board.getCols() - 1 - move
+        self.entries.pop(key, None)
+        self.entries[key] = (move, score)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        """Returns the fraction of lookups that found a decision."""
+
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def report(self):
+        """Prints how well the cache has done."""
+
+        print "decision cache: %d hits, %d misses (%.1f%%), %d positions" % (
+            self.hits, self.misses, 100 * self.hit_rate(), len(self.entries))
+
+    def save(self, path=None):
+        """
+        Writes the decisions to a file (the cache's own one if not given), in
+        order of use so that the least recently used still go first.
+        """
+
+        if path is None:
+            path = self.path
+        assert path is not None, "No file to save the cache to."
+
+        # writes to a new file and then renames it, so an interrupted save
+        # doesn't lose the old cache
+        f = open(path + ".tmp", "wb")
+        pickle.dump(self.entries.items(), f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(path + ".tmp", path)
+
+    def load(self, path):
+        """
+        Reads decisions from a file written by save(), keeping the most
+        recently used ones if there are more than fit.
+        """
+
+        f = open(path, "rb")
+        items = pickle.load(f)
+        f.close()
+        for key, entry in items[-self.size:]:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
@@ -0,0 +1,96 @@
+'''
+final_clock.py
+
+This module contains the time manager that shares a game's time budget out
+between the moves of the game.
+'''
+
+import time
+
+
+class TimeManager:
+    """
+    Keeps track of how much of a game's time budget is left, and decides how
+    much of it the next move gets. Complicated positions get more than their
+    share and forced moves get very little, so that the whole game fits in
+    the budget.
+    """
+
+    def __init__(self, budget, increment=0.0, max_share=0.25):
+        """
+        Attributes:
+            budget: seconds for the whole game
+            increment: seconds added to what's left after each move
+            max_share: the most of what's left any one move can have
+            remaining: seconds left for the rest of the game
+            started: when the current move started, or None between moves
+        """
+
+        assert budget > 0
+        assert increment >= 0
+        self.budget = budget
+        self.increment = increment
+        self.max_share = max_share
+        self.remaining = float(budget)
+        self.started = None
+
+    def reset(self):
+        """Starts a new game with the full budget."""
+
+        self.remaining = float(self.budget)
+        self.started = None
+
+    def start(self):
+        """Starts the clock for a move."""
+
+        self.started = time.time()
+
+    def elapsed(self):
+        """Returns the seconds spent on the current move so far."""
+
+        if self.started is None:
+            return 0.0
+        return time.time() - self.started
+
+    def stop(self):
+        """
+        Stops the clock for a move, takes the time it used off what's left
+        and adds the increment. Returns the seconds the move used.
+        """
+
+        used = self.elapsed()
+        self.remaining = max(0.0, self.remaining - used) + self.increment
+        self.started = None
+        return used
+
+    def moves_left(self, board):
+        """
+        Guesses how many more moves we'll have to make this game: half of
+        the empty squares, since the other player fills the rest.
+        """
+
+        empty = board.getKey().count("0")
+        return max(1, (empty + 1) // 2)
+
+    def allot(self, board, complexity):
+        """
+        Returns how many seconds the current move should take in total.
+        Arguments:
+            board: the position we're moving in
+            complexity: how many moves are still worth thinking about, i.e.
+            the ones that are neither proven wins nor proven losses; 1 or
+            less means the move is forced
+        """
+
+        # forced moves get a token amount, just enough to play them
+        if complexity <= 1:
+            return min(0.01, self.remaining * self.max_share)
+
+        # otherwise, an even share of what's left (counting the increments
+        # to come), scaled up or down by how many moves there are to weigh
+        # up against a position with half the columns open
+        moves_left = self.moves_left(board)
+        share = (self.remaining + self.increment * (moves_left - 1)) / \
+            moves_left
+        share *= 2.0 * complexity / board.getCols()
+        return min(share, self.remaining * self.max_share)
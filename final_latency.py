@@ -0,0 +1,168 @@
+'''
+final_latency.py
+
+This module records how long players take to choose their moves, and
+reports the percentiles, so that settings can be picked against an actual
+time limit instead of a few timings done by hand.
+'''
+
+import math
+import time
+
+# the histogram buckets start at this many seconds and each one is this much
+# wider than the last, which keeps every reading within about 9%
+SMALLEST = 1e-5
+RATIO = 2 ** 0.125
+BUCKETS = 240
+
+# the game phases moves are grouped into, by how many pieces are on the board
+PHASES = [("opening", 14), ("middlegame", 28), ("endgame", None)]
+
+
+class LatencyHistogram:
+    """
+    Counts times in buckets that grow exponentially, so recording a time is
+    just a logarithm and an addition, and the memory used is the same no
+    matter how many times are recorded.
+    """
+
+    def __init__(self):
+        """
+        Attributes:
+            counts: how many times fell in each bucket
+            count, total, largest: the number, sum and largest of the times
+        """
+
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.largest = 0.0
+
+    def record(self, seconds):
+        """Adds a time to the histogram."""
+
+        if seconds <= SMALLEST:
+            i = 0
+        else:
+            i = min(BUCKETS - 1,
+                int(math.log(seconds / SMALLEST) / math.log(RATIO)) + 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.largest:
+            self.largest = seconds
+
+    def percentile(self, p):
+        """
+        Returns the time that p percent of the recorded times are at or
+        under, to the accuracy of the buckets (it gives the top of the
+        bucket, so it errs on the slow side).
+        """
+
+        if self.count == 0:
+            return 0.0
+        needed = math.ceil(self.count * p / 100.0)
+        seen = 0
+        for i in range(BUCKETS):
+            seen += self.counts[i]
+            if seen >= needed:
+                return min(SMALLEST * RATIO ** i, self.largest)
+        return self.largest
+
+    def merge(self, other):
+        """Adds all the times recorded in another histogram to this one."""
+
+        for i in range(BUCKETS):
+            self.counts[i] += other.counts[i]
+        self.count += other.count
+        self.total += other.total
+        self.largest = max(self.largest, other.largest)
+
+
+def phase(board):
+    """Returns the name of the game phase of a position."""
+
+    pieces = board.getCols() * board.getRows() - board.getKey().count("0")
+    for name, limit in PHASES:
+        if limit is None or pieces < limit:
+            return name
+
+
+class LatencyRecorder:
+    """
+    Keeps a LatencyHistogram for every player and game phase, and prints or
+    exports them.
+    """
+
+    def __init__(self):
+        """
+        Attributes:
+            histograms: maps (player name, phase) to a LatencyHistogram
+        """
+
+        self.histograms = {}
+
+    def record(self, name, board, seconds):
+        """
+        Records that the player called 'name' took 'seconds' to choose a move
+        on 'board' (the position before the move).
+        """
+
+        key = (name, phase(board))
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram()
+        self.histograms[key].record(seconds)
+
+    def time_move(self, name, player, board, toMove):
+        """
+        Calls player.chooseMove(board, toMove), records how long it took
+        and returns the move.
+        """
+
+        started = time.time()
+        move = player.chooseMove(board, toMove)
+        self.record(name, board, time.time() - started)
+        return move
+
+    def rows(self):
+        """
+        Returns a list of (name, phase, count, p50, p90, p99, max) for every
+        player and phase, plus an "all" phase for each player.
+        """
+
+        names = sorted(set([name for name, p in self.histograms]))
+        rows = []
+        for name in names:
+            overall = LatencyHistogram()
+            for phase_name, limit in PHASES:
+                h = self.histograms.get((name, phase_name))
+                if h is None:
+                    continue
+                overall.merge(h)
+                rows.append(summary(name, phase_name, h))
+            rows.append(summary(name, "all", overall))
+        return rows
+
+    def report(self):
+        """Prints the percentiles for every player and phase, in seconds."""
+
+        print "%-28s %-10s %6s %8s %8s %8s %8s" % ("player", "phase", "moves",
+            "p50", "p90", "p99", "max")
+        for row in self.rows():
+            print "%-28s %-10s %6d %8.3f %8.3f %8.3f %8.3f" % row
+
+    def export(self, path):
+        """Writes the percentiles to a CSV file."""
+
+        f = open(path, "w")
+        f.write("player,phase,moves,p50,p90,p99,max\n")
+        for row in self.rows():
+            f.write("%s,%s,%d,%f,%f,%f,%f\n" % row)
+        f.close()
+
+
+def summary(name, phase_name, histogram):
+    """Returns the row of LatencyRecorder.rows() for one histogram."""
+
+    return (name, phase_name, histogram.count, histogram.percentile(50),
+        histogram.percentile(90), histogram.percentile(99), histogram.largest)
@@ -0,0 +1,276 @@
+'''
+final_mcts.py
+
+This module contains a Monte Carlo tree search that can have several
+simulated games running at once in worker processes, all started from
+different places in one shared tree.
+'''
+
+import math
+import Queue
+import random
+import traceback
+import multiprocessing
+from Connect4Simulator import *
+from final_board import *
+from final_rollouts import *
+
+
+def playout(args):
+    """
+    Simulates one game from a position with BetterPlayer on both sides. This
+    runs in the worker processes (or in this one, if there are none).
+    Arguments:
+        args: a tuple (key, toMove, seed, tag), where key is the board key of
+        the position and tag is handed back untouched
+    Returns (tag, winner, moves), with winner 0 for a draw and moves the
+    list of (player, column) pairs that were played.
+    """
+
+    # imported here because final_players imports this module
+    from final_players import BetterPlayer
+
+    key, toMove, seed, tag = args
+    random.seed(seed)
+    board = Connect4Board()
+    board.setKey(key)
+    c4s = Connect4Simulator(board, BetterPlayer(), BetterPlayer(), toMove)
+    winner = c4s.simulate()
+    return (tag, winner, c4s.moves)
+
+
+def guarded_playout(args):
+    """
+    Runs playout() in a worker process. The pool only calls its callback
+    for results, so an exception in a worker would leave the search waiting
+    forever; instead it comes back as (tag, None, the traceback).
+    """
+
+    try:
+        return playout(args)
+    except Exception:
+        return (args[3], None, traceback.format_exc())
+
+
+class Node:
+    """
+    A position in the search tree, reached by 'player' playing 'move'.
+    """
+
+    def __init__(self, move, player, moves, result=None):
+        """
+        Attributes:
+            move, player: the move that led here, and who made it
+            untried: the moves from here that have no child yet
+            children: maps each move tried from here to its Node
+            wins: the games through here won by 'player', with draws
+            counting a half
+            visits: the games through here that have finished
+            pending: the games through here that are still being simulated
+            result: if the game is over here, the winner (0 for a draw)
+            amaf: the AmafStats for the moves from here, if rave is on
+        """
+
+        self.move = move
+        self.player = player
+        self.untried = moves
+        self.children = {}
+        self.wins = 0.0
+        self.visits = 0
+        self.pending = 0
+        self.result = result
+        self.amaf = None
+
+
+class TreeSearch:
+    """
+    Grows a tree one simulated game at a time: go down the tree picking the
+    most promising child each time (UCT), add a child at the bottom, play
+    the game out from there, and count the result in every node on the way
+    back up.
+
+    With workers, up to that many games are out being simulated at a time,
+    and the tree is updated as each one comes back. Each game still out
+    counts as a loss (a "virtual loss") for every node on its way down
+    until it does, which is what stops all the workers being sent down the
+    same line.
+    """
+
+    def __init__(self, workers=None, exploration=1.0, virtual_loss=1,
+        rave=None):
+        """
+        Attributes:
+            workers: how many worker processes to simulate games in; games
+            are simulated one at a time in this process if not given
+            exploration: the UCT constant; higher tries more moves
+            virtual_loss: how many lost games each game still out counts as
+            rave: if given, each node also keeps AmafStats with this
+            equivalence setting, and blends them into its children's win
+            rates (see AmafStats)
+            pool: the worker processes
+            root: the tree from the last search
+        """
+
+        assert exploration >= 0
+        assert virtual_loss >= 0
+        self.workers = workers
+        self.exploration = exploration
+        self.virtual_loss = virtual_loss
+        self.rave = rave
+        self.pool = None
+        if workers:
+            self.pool = multiprocessing.Pool(workers)
+        self.root = None
+
+    def search(self, board, player, playouts):
+        """
+        Builds a tree from the position on 'board' with 'player' to move, by
+        simulating 'playouts' games, and returns its root.
+        """
+
+        self.root = self.new_node(None, 3 - player, board.possibleMoves())
+        results = Queue.Queue()
+        paths = {}
+        started = 0
+        while started < playouts or paths:
+            # keeps every worker busy, or does one game at a time without
+            # any
+            while started < playouts and len(paths) < (self.workers or 1):
+                board2 = board.clone()
+                path = self.select(board2)
+                started += 1
+                leaf = path[-1]
+                if leaf.result is not None:
+                    self.back_up(path, leaf.result, [])
+                    continue
+                args = (board2.getKey(), 3 - leaf.player,
+                    random.getrandbits(32), started)
+                paths[started] = path
+                if self.pool is None:
+                    results.put(playout(args))
+                else:
+                    self.pool.apply_async(guarded_playout, (args,),
+                        callback=results.put)
+
+            if paths:
+                tag, winner, moves = results.get()
+                if winner is None:
+                    raise RuntimeError("A simulated game failed in a "
+                        "worker:\n%s" % moves)
+                self.back_up(paths.pop(tag), winner, moves)
+        return self.root
+
+    def new_node(self, move, player, moves, result=None):
+        """Returns a new Node, with AmafStats if rave is on."""
+
+        node = Node(move, player, moves, result)
+        if self.rave:
+            node.amaf = AmafStats(self.rave)
+        return node
+
+    def select(self, board):
+        """
+        Goes down the tree from the root, playing the moves on 'board', and
+        adds one new node at the bottom unless the game is over there.
+        Counts a pending game in every node on the way.
+
+        Return value: the list of nodes from the root down.
+        """
+
+        node = self.root
+        node.pending += 1
+        path = [node]
+        while node.result is None:
+            toMove = 3 - node.player
+            if node.untried:
+                move = node.untried.pop(random.randrange(len(node.untried)))
+                board.makeMove(move, toMove)
+                if board.isWin(move):
+                    child = self.new_node(move, toMove, [], toMove)
+                elif board.isDraw():
+                    child = self.new_node(move, toMove, [], 0)
+                else:
+                    child = self.new_node(move, toMove,
+                        board.possibleMoves())
+                node.children[move] = child
+                child.pending += 1
+                path.append(child)
+                break
+
+            node = self.best_child(node)
+            board.makeMove(node.move, toMove)
+            node.pending += 1
+            path.append(node)
+        return path
+
+    def best_child(self, node):
+        """Returns the child of 'node' with the highest UCT score."""
+
+        total = node.visits + self.virtual_loss * node.pending
+        log_total = math.log(max(1, total))
+        best = None
+        best_score = None
+        for move in sorted(node.children):
+            child = node.children[move]
+
+            # games still out count as losses, so their wins aren't added
+            games = child.visits + self.virtual_loss * child.pending
+            if games == 0:
+                return child
+            if node.amaf is not None:
+                rate = node.amaf.blend(move, child.wins, games)
+            else:
+                rate = child.wins / games
+            score = rate + self.exploration * math.sqrt(log_total / games)
+            if best_score is None or score > best_score:
+                best = child
+                best_score = score
+        return best
+
+    def back_up(self, path, winner, moves):
+        """
+        Counts a finished game in every node of 'path', taking back the
+        pending game it counted on the way down. 'moves' are the (player,
+        column) pairs played after the bottom of the path, for the AMAF
+        statistics.
+        """
+
+        line = [(node.player, node.move) for node in path[1:]] + moves
+        for i in range(len(path)):
+            node = path[i]
+            node.pending -= 1
+            node.visits += 1
+            if winner == node.player:
+                node.wins += 1
+            elif winner == 0:
+                node.wins += 0.5
+
+            if node.amaf is not None and i < len(line):
+                mover, col = line[i]
+                if winner == mover:
+                    won = 1
+                elif winner == 0:
+                    won = 0.5
+                else:
+                    won = 0
+                node.amaf.record(mover, col, line[i + 1:], won)
+
+    def best_move(self):
+        """
+        Returns the move at the root of the last search that was tried the
+        most (the first one, if there's a tie).
+        """
+
+        best = None
+        for move in sorted(self.root.children):
+            child = self.root.children[move]
+            if best is None or child.visits > self.root.children[best].visits:
+                best = move
+        return best
+
+    def close(self):
+        """Shuts down the worker processes."""
+
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
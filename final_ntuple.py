@@ -0,0 +1,292 @@
+'''
+final_ntuple.py
+
+This module contains an evaluation function made of n-tuple pattern tables.
+Each n-tuple is a small group of squares (every line of four, and every
+block three wide and two high), and each has a table with a weight for
+every way its squares can be filled. A position is scored by adding up one
+weight from each table, so it costs a handful of lookups instead of a few
+hundred simulated games.
+
+The weights are trained offline from the positions written by
+Connect4SelfPlay.py (see Connect4Train.py), with NumPy if it's there (and
+many times more slowly without it); playing with them only needs the
+standard library.
+'''
+
+import os
+import math
+import array
+import random
+
+# NumPy makes train() and evaluate_batch() much faster, but neither needs it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_tuples(rows=6, cols=7):
+    """
+    Returns the list of n-tuples, each a list of square numbers in board key
+    order (column * rows + row): every line of four in any direction, then
+    every block three columns wide and two rows high.
+    """
+
+    tuples = []
+    for dc, dr in [(1, 0), (0, 1), (1, 1), (1, -1)]:
+        for c in range(cols):
+            for r in range(rows):
+                squares = [(c + i * dc, r + i * dr) for i in range(4)]
+                if all([0 <= x < cols and 0 <= y < rows for x, y in squares]):
+                    tuples.append([x * rows + y for x, y in squares])
+    for c in range(cols - 2):
+        for r in range(rows - 1):
+            tuples.append([(c + i) * rows + r + j for i in range(3)
+                for j in range(2)])
+    return tuples
+
+
+def mirror_key(key, rows=6):
+    """Returns the board key of the mirror image of a position."""
+
+    columns = [key[c:c + rows] for c in range(0, len(key), rows)]
+    return ''.join(reversed(columns))
+
+
+class NTupleEvaluator:
+    """
+    Scores positions for the player to move with n-tuple pattern tables. A
+    score is between -1 (sure to lose) and 1 (sure to win).
+    """
+
+    def __init__(self, weights=None, rows=6, cols=7):
+        """
+        Attributes:
+            tuples: the n-tuples (see make_tuples())
+            offsets: where each n-tuple's table starts in weights
+            size: the total number of weights
+            weights: every table, one after the other, as an array of floats
+        """
+
+        self.rows = rows
+        self.cols = cols
+        self.tuples = make_tuples(rows, cols)
+        self.offsets = []
+        self.size = 0
+        for squares in self.tuples:
+            self.offsets.append(self.size)
+            self.size += 3 ** len(squares)
+
+        if weights is None:
+            weights = array.array('f', [0.0] * self.size)
+        assert len(weights) == self.size, "Wrong number of weights."
+        self.weights = weights
+
+    def indices(self, key, player):
+        """
+        Returns the index in weights of the entry that each n-tuple looks up
+        for the position with this board key, with 'player' to move.
+        """
+
+        # squares are 0 if empty, 1 if the player to move has a piece there
+        # and 2 if the other player does, so both players share the tables
+        if player == 2:
+            key = key.replace("1", "x").replace("2", "1").replace("x", "2")
+
+        result = []
+        for i in range(len(self.tuples)):
+            pattern = ''.join([key[s] for s in self.tuples[i]])
+            result.append(self.offsets[i] + int(pattern, 3))
+        return result
+
+    def evaluate(self, board, player):
+        """Returns the score of the position on 'board' for 'player'."""
+
+        weights = self.weights
+        total = 0.0
+        for i in self.indices(board.getKey(), player):
+            total += weights[i]
+        return math.tanh(total)
+
+    def evaluate_batch(self, positions):
+        """
+        Returns the scores of a list of (board key, player to move)
+        positions, for the players to move. Uses NumPy to do them all at
+        once if it's there.
+        """
+
+        if numpy is None:
+            weights = self.weights
+            scores = []
+            for key, player in positions:
+                total = 0.0
+                for i in self.indices(key, player):
+                    total += weights[i]
+                scores.append(math.tanh(total))
+            return scores
+
+        x = numpy.array([self.indices(key, player)
+            for key, player in positions], dtype=numpy.int64)
+        w = numpy.array(self.weights, dtype=numpy.float64)
+        return numpy.tanh(w[x].sum(axis=1)).tolist()
+
+    def best_move(self, board, player, moves):
+        """
+        Returns whichever of 'moves' leaves the other player with the worst
+        score (the first one, if there's a tie).
+        """
+
+        player2 = player % 2 + 1
+        best = None
+        best_score = None
+        for move in moves:
+            if board.isWinningMove(move, player):
+                return move
+            board.makeMove(move, player)
+            if board.isDraw():
+                score = 0.0
+            else:
+                score = -self.evaluate(board, player2)
+            board.unmakeMove(move)
+            if best_score is None or score > best_score:
+                best = move
+                best_score = score
+        return best
+
+    def save(self, path):
+        """Writes the weights to a file."""
+
+        f = open(path, "wb")
+        self.weights.tofile(f)
+        f.close()
+
+    def load(self, path):
+        """Reads the weights back from a file written by save()."""
+
+        weights = array.array('f')
+        f = open(path, "rb")
+        weights.fromfile(f, self.size)
+        f.close()
+        self.weights = weights
+
+
+def load_positions(directory):
+    """
+    Reads the positions written by Connect4SelfPlay.py into a list of
+    (key, player to move, outcome) tuples.
+    """
+
+    positions = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith("positions_") and name.endswith(".txt")):
+            continue
+        f = open(os.path.join(directory, name))
+        for line in f:
+            fields = line.split()
+            positions.append((fields[0], int(fields[1]), int(fields[4])))
+        f.close()
+    return positions
+
+
+def train(positions, evaluator=None, epochs=20, rate=1.0, batch=256,
+    report=None):
+    """
+    Fits the weights of an evaluator to game outcomes, by minibatch gradient
+    descent on the squared error between the score and the outcome. Every
+    position is used along with its mirror image.
+    Arguments:
+        positions: a list of (key, player to move, outcome) tuples, with the
+        outcome 1, 0 or -1 for the player to move
+        evaluator: the NTupleEvaluator to train; a new one if not given
+        epochs: how many times to go through the positions
+        rate: the learning rate; each step moves a position's score
+        (before the tanh) by about rate times its error, however many
+        n-tuples there are
+        batch: how many positions to average each step over
+        report: if given, called as report(epoch, mean squared error)
+    Returns the evaluator.
+    """
+
+    if evaluator is None:
+        evaluator = NTupleEvaluator()
+
+    rows = evaluator.rows
+    indices = []
+    outcomes = []
+    for key, player, outcome in positions:
+        indices.append(evaluator.indices(key, player))
+        indices.append(evaluator.indices(mirror_key(key, rows), player))
+        outcomes.extend([outcome, outcome])
+
+    # every position looks up one weight per n-tuple, and all of them move,
+    # so the step for each is divided between them; without that the
+    # scores overshoot and the error never comes down
+    rate = rate / len(evaluator.tuples)
+
+    if numpy is None:
+        w = train_slowly(indices, outcomes, list(evaluator.weights), epochs,
+            rate, batch, report)
+        evaluator.weights = array.array('f', w)
+        return evaluator
+
+    x = numpy.array(indices, dtype=numpy.int64)
+    y = numpy.array(outcomes, dtype=numpy.float64)
+    w = numpy.array(evaluator.weights, dtype=numpy.float64)
+
+    order = numpy.arange(len(y))
+    for epoch in range(epochs):
+        numpy.random.shuffle(order)
+        for start in range(0, len(y), batch):
+            rows_now = order[start:start + batch]
+            xb = x[rows_now]
+            score = numpy.tanh(w[xb].sum(axis=1))
+
+            # the gradient of the squared error through the tanh goes to
+            # every weight that was looked up for the position
+            error = (score - y[rows_now]) * (1 - score * score)
+            gradient = numpy.zeros_like(w)
+            numpy.add.at(gradient, xb,
+                numpy.repeat(error[:, None], xb.shape[1], axis=1))
+            w -= rate * gradient / len(rows_now)
+
+        if report is not None:
+            score = numpy.tanh(w[x].sum(axis=1))
+            report(epoch, float(((score - y) ** 2).mean()))
+
+    evaluator.weights = array.array('f', w.astype(numpy.float32).tolist())
+    return evaluator
+
+
+def train_slowly(indices, outcomes, w, epochs, rate, batch, report):
+    """
+    Does the same gradient descent as train(), on a list of weights 'w',
+    without NumPy, for when it isn't installed. Returns the weights.
+    """
+
+    order = range(len(outcomes))
+    for epoch in range(epochs):
+        random.shuffle(order)
+        for start in range(0, len(order), batch):
+            rows_now = order[start:start + batch]
+
+            # every step's gradient comes from the weights before the step,
+            # so it's added up first and only then applied
+            gradient = {}
+            for row in rows_now:
+                looked_up = indices[row]
+                score = math.tanh(sum([w[i] for i in looked_up]))
+                error = (score - outcomes[row]) * (1 - score * score)
+                for i in looked_up:
+                    gradient[i] = gradient.get(i, 0.0) + error
+            step = rate / len(rows_now)
+            for i, g in gradient.items():
+                w[i] -= step * g
+
+        if report is not None:
+            total = 0.0
+            for row in range(len(outcomes)):
+                score = math.tanh(sum([w[i] for i in indices[row]]))
+                total += (score - outcomes[row]) ** 2
+            report(epoch, total / len(outcomes))
+    return w
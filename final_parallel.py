@@ -0,0 +1,246 @@
+'''
+final_parallel.py
+
+This module contains a parallel version of Minimax's search. The moves at
+the top of the tree have independent subtrees, and the Monty simulations
+that follow are independent games, so both are handed out to a pool of
+worker processes.
+'''
+
+import random
+import multiprocessing
+from final_board import *
+from final_search import *
+from final_table import *
+
+# how many games of a move's Monty simulations each task runs; smaller
+# batches share the work out more evenly between the workers
+ROLLOUT_BATCH = 25
+
+# how often (in positions) a worker checks whether its search is still wanted
+CHECK_EVERY = 1024
+
+# the worker processes' copies of the shared cutoff, the shared
+# transposition table and their searches, which are set up once per process
+# by init_worker()
+worker_cutoff = None
+worker_table = None
+worker_searches = {}
+
+
+class SearchAborted(Exception):
+    '''
+    Raised inside a worker when the search it's running is no longer
+    needed, because an earlier move has been found to win.
+    '''
+    pass
+
+
+class CutoffSearch(NullWindowSearch):
+    """
+    A NullWindowSearch that gives up as soon as the shared cutoff says that a
+    move earlier than its own has already been found to win.
+    """
+
+    def __init__(self, mode, cutoff, table=None):
+        """
+        Attributes:
+            cutoff: the shared multiprocessing.Value holding the index of the
+            earliest winning move found so far
+            index: the index of the move this search is for
+        """
+
+        NullWindowSearch.__init__(self, mode, table)
+        self.cutoff = cutoff
+        self.index = 0
+
+    def search(self, board, player, depth, alpha, beta):
+        """Checks the cutoff every so often, then searches as usual."""
+
+        if self.nodes % CHECK_EVERY == 0 and self.cutoff.value < self.index:
+            raise SearchAborted
+        return NullWindowSearch.search(self, board, player, depth, alpha, beta)
+
+
+def init_worker(cutoff, table):
+    """
+    Runs once in each worker process to hand it the shared cutoff and the
+    shared transposition table.
+    """
+
+    global worker_cutoff, worker_table
+    worker_cutoff = cutoff
+    worker_table = table
+
+
+def search_move(args):
+    """
+    Finds the value of one move at the top of the tree. This runs in the
+    worker processes.
+    Arguments:
+        args: a tuple (key, index, move, player, depth, mode), where key is
+        the board key of the position and index is the position of move in
+        the list of moves
+    Returns (index, value), or (index, None) if the search was abandoned.
+    """
+
+    key, index, move, player, depth, mode = args
+
+    # each worker keeps its own search between tasks and between turns, but
+    # they all share one transposition table, so a position searched by one
+    # worker never has to be searched by another
+    if mode not in worker_searches:
+        worker_searches[mode] = CutoffSearch(mode, worker_cutoff, worker_table)
+    search = worker_searches[mode]
+    search.index = index
+    search.nodes = 0
+
+    board = Connect4Board()
+    board.setKey(key)
+    board.makeMove(move, player)
+    try:
+        value = -search.value(board, player % 2 + 1, depth - 1)
+    except SearchAborted:
+        return (index, None)
+    finally:
+        # an abandoned search never gets to take its moves back off the
+        # line, and the search is used again for the next task
+        search.line = []
+
+    # a win here makes every later move irrelevant, so tell the others
+    if value == 1:
+        worker_cutoff.get_lock().acquire()
+        if index < worker_cutoff.value:
+            worker_cutoff.value = index
+        worker_cutoff.get_lock().release()
+    return (index, value)
+
+
+def simulate_move(args):
+    """
+    Simulates a batch of games after a move and counts the wins. This runs
+    in the worker processes.
+    Arguments:
+        args: a tuple (key, move, player, games, seed, adjudicator), where
+        adjudicator is for the Monty (see Connect4Simulator.py), or None
+    Returns (move, wins).
+    """
+
+    # imported here because final_players imports this module
+    from final_players import Monty
+
+    key, move, player, games, seed, adjudicator = args
+    random.seed(seed)
+    board = Connect4Board()
+    board.setKey(key)
+    monty = Monty(games, player, adjudicator=adjudicator)
+    wins = 0
+    for i in range(games):
+        wins += monty.rollout(board, move, player)
+    return (move, wins)
+
+
+class ParallelSearch:
+    """
+    Splits Minimax's work at the top of the tree between a pool of worker
+    processes: one search per move, then batches of Monty games.
+    """
+
+    def __init__(self, workers, mode="mtdf", table=None):
+        """
+        Attributes:
+            workers: how many worker processes to start
+            mode: the NullWindowSearch mode the workers search with
+            cutoff: shared with the workers; the index of the earliest move
+            known to win in the current search
+            table: the SharedTable the workers all use; one is made if not
+            given
+            pool: the worker processes
+        """
+
+        assert workers > 0
+        self.workers = workers
+        self.mode = mode
+        self.cutoff = multiprocessing.Value("i", 0)
+        if table is None:
+            table = SharedTable()
+        self.table = table
+        self.pool = multiprocessing.Pool(workers, init_worker,
+            (self.cutoff, self.table))
+
+    def move_table(self, board, player, depth):
+        """
+        Returns the same dictionary of win/loss/indeterminate values as
+        Minimax.Tree.move_table(), searching the moves in parallel.
+        """
+
+        moves = board.possibleMoves()
+        key = board.getKey()
+
+        # immediate wins are quick to check, and the tree stops at the first
+        # one it finds, so nothing after it needs searching
+        for i in range(len(moves)):
+            if board.isWinningMove(moves[i], player):
+                moves = moves[:i + 1]
+                break
+
+        self.cutoff.value = len(moves)
+        tasks = [(key, i, moves[i], player, depth, self.mode)
+            for i in range(len(moves))]
+        values = dict(self.pool.map(search_move, tasks, 1))
+
+        # rebuilds the table in move order, stopping at the first win just
+        # like the tree; anything that was abandoned comes after that win
+        result = {-1:[], 0:[], 1:[]}
+        for i in range(len(moves)):
+            if board.isWinningMove(moves[i], player):
+                result[1].append(moves[i])
+                break
+            result[values[i]].append(moves[i])
+            if values[i] == 1:
+                break
+        return result
+
+    def monty(self, board, player, moves, n, adjudicator=None):
+        """
+        Does what Monty(n, player, moves, adjudicator=adjudicator).chooseMove(
+        board, player) does with the fixed mode, but with the games split
+        between the workers.
+        """
+
+        player2 = player % 2 + 1
+        for move in moves:
+            if board.isWinningMove(move, player):
+                return move
+        for move in moves:
+            if board.isWinningMove(move, player2):
+                return move
+
+        key = board.getKey()
+        tasks = []
+        for move in moves:
+            games = n
+            while games > 0:
+                batch = min(games, ROLLOUT_BATCH)
+                tasks.append((key, move, player, batch,
+                    random.getrandbits(32), adjudicator))
+                games -= batch
+
+        dwin = dict([(move, 0) for move in moves])
+        for move, wins in self.pool.map(simulate_move, tasks, 1):
+            dwin[move] += wins
+
+        # same choice as Monty: the first move with the most wins
+        max_wins = -1
+        make_move = -1
+        for entry in dwin.keys():
+            if dwin[entry] > max_wins:
+                max_wins = dwin[entry]
+                make_move = entry
+        return make_move
+
+    def close(self):
+        """Shuts down the worker processes."""
+
+        self.pool.terminate()
+        self.pool.join()
@@ -8,8 +8,23 @@ This module contains code for various bots that play Connect4 at varying
 degrees of sophistication.
 '''
 
+import math
+import time
 import random
 from Connect4Simulator import *
+from final_board import *
+from final_search import *
+from final_parallel import *
+from final_clock import *
+from final_rollouts import *
+from final_ntuple import *
+from final_batch import *
+from final_mcts import *
+from final_cache import *
+from final_trace import *
+from final_threats import *
+from final_steps import *
+from final_store import *
 # Any other imports go here...
 
 
@@ -94,27 +109,33 @@ class BetterPlayer:
 
         assert moves != []
 
-        # returns winning move, as before
-        for move in moves:
-            if board.isWinningMove(move, player):
-                return move
+        # returns winning move, as before; winningMoves() gives the same moves
+        # in the same order as trying isWinningMove() on each, but doesn't
+        # have to clone the board each time, which matters here because
+        # this is what Monty's simulations spend most of their time on
+        wins = board.winningMoves(player)
+        if wins:
+            return wins[0]
 
         # winning move for the other player is the one to be blocked, and so
         # this returns that
-        for move in moves:
-            if board.isWinningMove(move, player2):
-                return move
+        blocks = board.winningMoves(player2)
+        if blocks:
+            return blocks[0]
 
         # otherwise, random
         return random.choice(moves)
 
+# the ways Monty can share out its simulations between the candidate moves
+MONTY_MODES = ["fixed", "halving", "bound", "anytime"]
+
 class Monty:
     '''
     This player will randomly simulate games for each possible move,
     picking the one that has the highest probability of success.
     '''
 
-    def __init__(self, n, player, *move_list):
+    def __init__(self, n, player, *move_list, **options):
         '''
         Initialize the player using a simpler computer player.
 
@@ -123,6 +144,50 @@ class Monty:
           player -- the computer player
           move_list -- a list of possible moves that Monty is supposed to
           simulate. If not given, it will simulate all possible moves.
+          options -- optional keyword settings:
+            mode       -- how the simulations are shared out between moves.
+                          "fixed" (the default) simulates n games for every
+                          move. "halving" spends the same total in rounds,
+                          dropping the worse half of the moves after each
+                          round. "bound" simulates the moves in turn and
+                          drops a move as soon as it is clearly worse than
+                          the best one, stopping when only one is left.
+                          "anytime" simulates one game for each move in
+                          turn until every move has had n games, time runs
+                          out or stop() is called, and then goes with the
+                          best move so far.
+            confidence -- how sure "bound" has to be (between 0 and 1)
+                          before it drops a move; defaults to 0.95
+            memory     -- if given, remember the results of up to this many
+                          positions from the simulations, and start from
+                          them when they come up again on a later turn
+            stats      -- a RolloutStats to remember results in, for
+                          sharing one memory between several Montys
+            store      -- a PositionStore (see final_store.py), or the name
+                          of its file, to remember results in on disk, so
+                          they're kept from one run to the next; close()
+                          writes them
+            time_limit -- for "anytime", the most seconds to spend on a move
+            callback   -- for "anytime", called every so often during a move
+                          as callback(best move, dictionary of each move's
+                          win rate), and once more at the end
+            interval   -- seconds between calls to callback; defaults to 0.5
+            adjudicator -- an Adjudicator (see Connect4Simulator.py) to end
+                          simulated games early
+            adjudicate -- if True and there's no adjudicator, use one that
+                          ends games at a double threat
+            adjudicate_plies -- if given and there's no adjudicator, use one
+                          that ends games as draws after this many moves
+                          (along with the double threats if adjudicate is
+                          True)
+            rave       -- if given, also count every simulated game for each
+                          column the player goes on to play first in it,
+                          and blend that in with this equivalence setting
+                          (see AmafStats in final_rollouts.py; a few hundred
+                          is about right). Used for picking the best move
+                          and in "halving", but "bound" sticks to the games
+                          each move really started, which its intervals
+                          need.
         '''
 
         assert n > 0
@@ -133,6 +198,48 @@ class Monty:
         else:
             self.move_list = move_list
 
+        self.mode = options.pop("mode", "fixed")
+        self.confidence = options.pop("confidence", 0.95)
+        self.stats = options.pop("stats", None)
+        store = options.pop("store", None)
+        if isinstance(store, str):
+            store = PositionStore(store)
+        if store is not None:
+            self.stats = store
+        memory = options.pop("memory", None)
+        if memory and self.stats is None:
+            self.stats = RolloutStats(memory)
+        self.time_limit = options.pop("time_limit", None)
+        self.callback = options.pop("callback", None)
+        self.interval = options.pop("interval", 0.5)
+        self.adjudicator = options.pop("adjudicator", None)
+        adjudicate = options.pop("adjudicate", False)
+        plies = options.pop("adjudicate_plies", None)
+        if (adjudicate or plies) and self.adjudicator is None:
+            self.adjudicator = Adjudicator(adjudicate, plies)
+        self.rave = options.pop("rave", None)
+        assert not options, "Unknown Monty options: %s" % options.keys()
+        assert self.mode in MONTY_MODES
+        assert 0 < self.confidence < 1
+
+        # how many games the last call to chooseMove() simulated
+        self.simulations = 0
+
+        # set by stop() to make an "anytime" move finish early
+        self.stopped = False
+
+        # the AmafStats for the move being chosen, if rave is on
+        self.amaf = None
+
+    def stop(self):
+        '''
+        Make the move that's being chosen (in "anytime" mode) finish as soon
+        as the game being simulated is over. Safe to call from another
+        thread.
+        '''
+
+        self.stopped = True
+
     def chooseMove(self, board, player):
         '''
         Given the current board and player number, choose and return a move.
@@ -145,88 +252,48 @@ class Monty:
         Invariant: The board state does not change.
         '''
 
-        # in this case, simulate all possible moves
-        if not self.move_list:
-            # makes 2 1 and 1 2
-            player2 = player % 2 + 1
-            moves = board.possibleMoves()
-
-            assert moves != []
-
-            # returns winning move, as before
-            for move in moves:
-                if board.isWinningMove(move, player):
-                    return move
-
-            # winning move for the other player is the one to be blocked, and so
-            # this returns that
-            for move in moves:
-                if board.isWinningMove(move, player2):
-                    return move
-
-            # "dictionary of wins", or dwin
-            # tracks how many wins each move gets in the simulation
-            # this block counts wins per move and appends it to dwin
-            dwin = {}
-            for move in moves:
-                wins = 0
-                for i in range(self.n):
-                    board2 = board.clone()
-                    board2.makeMove(move, player)
-                    c4s = Connect4Simulator(board2, BetterPlayer(),
-                        BetterPlayer(), player2)
-                    result = c4s.simulate()
-                    if result == player:
-                        wins += 1
-                dwin[move] = wins
-
-            ######################
-            # print dwin
-            ######################
-
-            if not dwin:
-                return random.choice(moves)
-
-            max_wins = -1
-            make_move = -1
-            for entry in dwin.keys():
-                if dwin[entry] > max_wins:
-                    max_wins = dwin[entry]
-                    make_move = entry
-            return make_move
-
+        # makes 2 1 and 1 2
         player2 = player % 2 + 1
+        self.simulations = 0
+        self.stopped = False
+        self.amaf = None
+        if self.rave:
+            self.amaf = AmafStats(self.rave)
 
         ######################
         # print self.move_list
         ######################
 
-        # otherwise, simulate only the moves in move_list
-        moves = self.move_list
+        # simulate only the moves in move_list if there is one, otherwise
+        # simulate all possible moves
+        if self.move_list:
+            moves = self.move_list
+        else:
+            moves = board.possibleMoves()
+
+        assert moves != []
 
-        # see above
+        # returns winning move, as before
         for move in moves:
             if board.isWinningMove(move, player):
                 return move
 
-        # see above
+        # winning move for the other player is the one to be blocked, and so
+        # this returns that
         for move in moves:
             if board.isWinningMove(move, player2):
                 return move
 
-        # see above
-        dwin = {}
-        for move in moves:
-            wins = 0
-            for i in range(self.n):
-                board2 = board.clone()
-                board2.makeMove(move, player)
-                c4s = Connect4Simulator(board2, BetterPlayer(),
-                    BetterPlayer(), player2)
-                result = c4s.simulate()
-                if result == player:
-                    wins += 1
-            dwin[move] = wins
+        # "dictionary of wins", or dwin
+        # tracks how many wins and games each move gets in the simulation
+        if self.mode == "halving":
+            dwin = self.halving(board, player, moves)
+        elif self.mode == "bound":
+            dwin = self.bound(board, player, moves)
+        elif self.mode == "anytime":
+            dwin = self.anytime(board, player, moves)
+        else:
+            dwin = self.fixed(board, player, moves)
 
         ######################
         # print dwin
@@ -236,17 +303,333 @@ class Monty:
         if not dwin:
             return random.choice(moves)
 
-        max_wins = -1
+        return self.best(dwin)
+
+    def best(self, dwin):
+        '''
+        Return value: the move in dwin with the highest win rate.
+        '''
+
+        # this avoids dividing by zero when only one move was in the running
+        # and so it never needed any games
+        if len(dwin) == 1:
+            return dwin.keys()[0]
+
+        max_rate = -1
         make_move = -1
         for entry in dwin.keys():
 
             # if dwin is all 0s, the stricty greater than allows the first move
             # to be selected
-            if dwin[entry] > max_wins:
-                max_wins = dwin[entry]
+            wins, games = dwin[entry]
+            if self.rate(entry, wins, games) > max_rate:
+                max_rate = self.rate(entry, wins, games)
                 make_move = entry
         return make_move
 
+    def rate(self, move, wins, games):
+        '''
+        Return value: the win rate of 'move' from its (wins, games), blended
+        with its AMAF win rate if rave is on.
+        '''
+
+        if self.amaf is not None:
+            return self.amaf.blend(move, wins, games)
+        return float(wins) / games
+
+    def rollout(self, board, move, player):
+        '''
+        Simulate one game after 'player' makes 'move' on 'board', with both
+        sides played by BetterPlayer.
+
+        Return value: 1 if 'player' won the game, else 0.
+        '''
+
+        board2 = board.clone()
+        board2.makeMove(move, player)
+        c4s = Connect4Simulator(board2, BetterPlayer(), BetterPlayer(),
+            player % 2 + 1, adjudicator=self.adjudicator)
+        self.simulations += 1
+        result = c4s.simulate()
+        if self.stats is not None:
+            self.stats.record(board, move, player, c4s.moves, result)
+        won = int(result == player)
+        if self.amaf is not None:
+            self.amaf.record(player, move, c4s.moves, won)
+        return won
+
+    def start(self, board, player, moves):
+        '''
+        Return value: a dictionary mapping each move to the (wins, games)
+        remembered from earlier turns, or to (0, 0) if there's no memory.
+        '''
+
+        if self.stats is None:
+            return dict([(move, (0, 0)) for move in moves])
+        return dict([(move, self.stats.prior(board, move, player, self.n))
+            for move in moves])
+
+    def fixed(self, board, player, moves):
+        '''
+        Simulate n games for every move. Games remembered from earlier turns
+        count towards the n, although every move gets at least a tenth of
+        its games fresh.
+
+        Return value: a dictionary mapping each move to (wins, games).
+        '''
+
+        dwin = self.start(board, player, moves)
+        for move in moves:
+            wins, games = dwin[move]
+            fresh = max(self.n - games, max(1, self.n // 10))
+            for i in range(fresh):
+                wins += self.rollout(board, move, player)
+            dwin[move] = (wins, games + fresh)
+        return dwin
+
+    def halving(self, board, player, moves):
+        '''
+        Sequential halving: split the same total number of games as fixed()
+        (less any remembered ones) into rounds, and after each round keep
+        only the better half of the moves, so the best moves get most of the
+        games.
+
+        Return value: a dictionary mapping the surviving move to (wins, games).
+        '''
+
+        dwin = self.start(board, player, moves)
+        remembered = sum([dwin[move][1] for move in moves])
+        budget = max(len(moves), self.n * len(moves) - remembered)
+        rounds = int(math.ceil(math.log(len(moves), 2)))
+        alive = list(moves)
+        while len(alive) > 1:
+            per_move = max(1, budget // (len(alive) * rounds))
+            for move in alive:
+                wins, games = dwin[move]
+                for i in range(per_move):
+                    wins += self.rollout(board, move, player)
+                dwin[move] = (wins, games + per_move)
+
+            # sorted() is stable, so ties keep the original order of the moves
+            alive = sorted(alive,
+                key=lambda m: -self.rate(m, dwin[m][0], dwin[m][1]))
+            alive = alive[:(len(alive) + 1) // 2]
+
+        return {alive[0]: dwin[alive[0]]}
+
+    def bound(self, board, player, moves):
+        '''
+        Simulate the moves in turn, a batch of games at a time, and drop any
+        move whose win rate is worse than the best one's with the required
+        confidence (using Hoeffding's inequality). Stops once a single move
+        is left, or once every move left has had n games.
+
+        Return value: a dictionary mapping each move still in the running to
+        (wins, games).
+        '''
+
+        batch = max(1, self.n // 10)
+
+        # the log term splits the allowed error between all the moves, so the
+        # confidence holds for the whole decision rather than for each move
+        log_term = math.log(2.0 * len(moves) / (1 - self.confidence))
+        dwin = self.start(board, player, moves)
+        alive = list(moves)
+        while len(alive) > 1:
+            short = [m for m in alive if dwin[m][1] < self.n]
+            if not short:
+                break
+            for move in short:
+                wins, games = dwin[move]
+                games_now = min(batch, self.n - games)
+                for i in range(games_now):
+                    wins += self.rollout(board, move, player)
+                dwin[move] = (wins, games + games_now)
+
+            # a move is dropped once even the most it could be worth (its win
+            # rate plus the width of its interval) is below the least the
+            # best move could be worth; moves with remembered games can have
+            # narrower intervals than the rest
+            widths = dict([(m, math.sqrt(log_term / (2.0 * dwin[m][1])))
+                for m in alive])
+            rates = dict([(m, float(dwin[m][0]) / dwin[m][1]) for m in alive])
+            best = max([rates[m] - widths[m] for m in alive])
+            alive = [m for m in alive if rates[m] + widths[m] >= best]
+
+        return dict([(move, dwin[move]) for move in alive])
+
+    def anytime(self, board, player, moves):
+        '''
+        Simulate one game for each move in turn, so that the counts are
+        always even and the best move so far is always worth going with,
+        until every move has had n games, the time limit is reached or
+        stop() is called. Calls the callback every interval seconds.
+
+        Return value: a dictionary mapping each move that has had at least
+        one game to (wins, games).
+        '''
+
+        started = time.time()
+        next_report = started + self.interval
+        dwin = self.start(board, player, moves)
+        while not self.stopped:
+            short = [m for m in moves if dwin[m][1] < self.n]
+            if not short:
+                break
+            for move in short:
+                wins, games = dwin[move]
+                dwin[move] = (wins + self.rollout(board, move, player),
+                    games + 1)
+
+            now = time.time()
+            if self.time_limit is not None and \
+                now - started >= self.time_limit:
+                break
+            if self.callback is not None and now >= next_report:
+                self.report(dwin)
+                next_report = now + self.interval
+
+        if self.callback is not None:
+            self.report(dwin)
+        return dict([(m, dwin[m]) for m in moves if dwin[m][1] > 0])
+
+    def report(self, dwin):
+        '''
+        Call the callback with the best move so far and each move's win
+        rate.
+        '''
+
+        played = dict([(m, dwin[m]) for m in dwin if dwin[m][1] > 0])
+        if not played:
+            return
+        rates = dict([(m, self.rate(m, played[m][0], played[m][1]))
+            for m in played])
+        self.callback(self.best(played), rates)
+
+    def close(self):
+        '''
+        Write out the results remembered in a PositionStore, if there is one.
+        '''
+
+        if isinstance(self.stats, PositionStore):
+            self.stats.flush()
+
+class Mcts:
+    '''
+    This is like Monty, but instead of spreading its simulations evenly
+    over the moves it grows a search tree (see TreeSearch in final_mcts.py),
+    so more of them go into the lines that matter and it looks deeper than
+    one move. With workers, several simulations run at once in different
+    parts of the tree.
+    '''
+
+    def __init__(self, n, player, **options):
+        '''
+        Initialize the player.
+
+        Arguments:
+          n       -- the number of games to simulate each turn, in all
+          player  -- which player the computer is going to be (1 or 2)
+          options -- optional keyword settings:
+            workers      -- how many worker processes to simulate games in
+            exploration  -- the UCT constant; defaults to 1.0
+            virtual_loss -- how many losses each game still being simulated
+                            counts as; defaults to 1
+            rave         -- if given, blend in "all moves as first"
+                            statistics at every node, with this equivalence
+                            setting (see AmafStats in final_rollouts.py)
+        '''
+
+        assert n > 0
+        self.n = n
+        self.player = player
+        workers = options.pop("workers", None)
+        exploration = options.pop("exploration", 1.0)
+        virtual_loss = options.pop("virtual_loss", 1)
+        rave = options.pop("rave", None)
+        assert not options, "Unknown Mcts options: %s" % options.keys()
+        self.search = TreeSearch(workers, exploration, virtual_loss, rave)
+
+        # how many games the last call to chooseMove() simulated
+        self.simulations = 0
+
+    def chooseMove(self, board, player):
+        '''
+        Given the current board and player number, choose and return a move.
+
+        Arguments:
+          board  -- a Connect4Board instance
+          player -- either 1 or 2
+
+        Precondition: There must be at least one legal move.
+        Invariant: The board state does not change.
+        '''
+
+        moves = board.possibleMoves()
+        assert moves != []
+        self.simulations = 0
+
+        # wins and blocks first, as in Monty
+        wins = board.winningMoves(player)
+        if wins:
+            return wins[0]
+        blocks = board.winningMoves(player % 2 + 1)
+        if blocks:
+            return blocks[0]
+
+        self.search.search(board, player, self.n)
+        self.simulations = self.n
+        return self.search.best_move()
+
+    def close(self):
+        '''
+        Shut down the worker processes, if there are any.
+        '''
+
+        self.search.close()
+
+class RolloutEvaluator:
+    '''
+    This scores positions by simulating games from them with BetterPlayer
+    playing both sides, for BatchedSearch.
+    '''
+
+    def __init__(self, n):
+        '''
+        Arguments:
+          n -- number of games to simulate from each position.
+        '''
+
+        assert n > 0
+        self.n = n
+
+    def evaluate_batch(self, positions):
+        '''
+        Simulates the games for each position in turn; there's no saving in
+        doing a batch of games at once, so this only has the same interface
+        as NTupleEvaluator's, and costs n games per position.
+
+        Return value: the scores of a list of (board key, player to move)
+        positions, each the wins less the losses of the player to move,
+        divided by the number of games.
+        '''
+
+        scores = []
+        for key, player in positions:
+            board = Connect4Board()
+            board.setKey(key)
+            total = 0
+            for i in range(self.n):
+                c4s = Connect4Simulator(board.clone(), BetterPlayer(),
+                    BetterPlayer(), player)
+                result = c4s.simulate()
+                if result == player:
+                    total += 1
+                elif result != 0:
+                    total -= 1
+            scores.append(float(total) / self.n)
+        return scores
+
 class Minimax:
     """
     Pretty much just wraps Tree and Node while contributing the chooseMove()
@@ -316,19 +699,26 @@ class Minimax:
 
                 self.move = move
 
-        def __init__(self, board, player, depth):
+        def __init__(self, board, player, depth, extension=None):
             """
             Attributes:
                 board: the Connect4Board on which it plays
                 player: which player is to play
                 depth: how many successive moves the tree should be made to
                 represent.
+                extension: if given, a function taking (board, player) that
+                gives the value for the player to move of each position at
+                the bottom of the tree, instead of leaving it indeterminate
+                (see ThreatSearch.forcing_value())
                 top: the top node of the tree
+                nodes: how many nodes the tree was made with
             """
 
             self.board = board
             self.player = player
             self.depth = depth
+            self.extension = extension
+            self.nodes = 0
 
             self.top = self.Node()
             self.top.setMove(-1)
@@ -348,6 +738,7 @@ class Minimax:
                 depth: how many levels to make the subtree.
             """
 
+            self.nodes += 1
             moves = board.possibleMoves()
 
             # this forces Minimax to treat draws as losses
@@ -408,6 +799,12 @@ class Minimax:
 
                     top.setValue(-max_value)
 
+            # at the bottom, the extension can still settle the position if
+            # it's in the middle of a forced sequence; negative for the same
+            # reason as above
+            elif self.extension is not None:
+                top.setValue(-self.extension(board, player))
+
         def pprint_helper(self, top, tabs):
             """
             Allows pprint() to be a neat one line.
@@ -457,7 +854,7 @@ class Minimax:
                 result[node.getValue()].append(node.getMove())
             return result
 
-    def __init__(self, player, *depthmonty):
+    def __init__(self, player, *depthmonty, **options):
         """
         Initializes Minimax.
         Attributes:
@@ -468,6 +865,78 @@ class Minimax:
             otherwise, it defaults to 5 for depth and 100 for monty
             depth: how deep to search (i.e. how many levels the tree should be)
             monty: how many simulations to run for indeterminate moves
+            options: optional keyword settings:
+                monty_mode: the mode of the Monty used for indeterminate
+                moves (see Monty); defaults to "fixed"
+                confidence: the confidence of that Monty, for "bound"
+                search: how to find the values of the moves; "tree" (the
+                default) builds the whole Tree, while "pvs" and "mtdf" use
+                a NullWindowSearch, which gets the same values while
+                visiting far fewer positions. "batched" uses a
+                BatchedSearch, which also scores the indeterminate moves (so
+                Monty isn't needed) by evaluating the positions at the bottom
+                of the tree in batches, with the evaluator if there is one
+                and leaf_rollouts simulated games per position if not
+                leaf_rollouts: see search; defaults to 2. Every position at
+                the bottom of the tree costs that many games, and at depth
+                5 there are typically several hundred to a few thousand of
+                them (about 2000 from the empty board), so with rollouts the
+                batched search is best kept to depth 3 or 4
+                adjudicate: if True, the Montys end their simulated games as
+                soon as one side has a double threat
+                adjudicate_plies: if given, the Montys end their simulated
+                games as draws after this many moves, which saves more time
+                than adjudicate does but makes the results rougher
+                rave: if given, the Montys blend in "all moves as first"
+                statistics with this equivalence setting (see Monty)
+                workers: if given, how many worker processes to split the
+                search between (see ParallelSearch); the workers always use
+                a null-window search, "mtdf" unless search is "pvs"; in
+                the fixed monty_mode they play the Monty games too (ended as
+                adjudicate says), unless there's memory, a store or rave,
+                which only this process has, when the games are played here
+                table: the transposition table for the null-window search to
+                use; pass the same SharedTable to several Minimaxes (made
+                before any of their processes start) to have them all share
+                their results; they must all have the same extend settings
+                time: if given, the seconds Minimax has for a whole game (see
+                TimeManager); depth and monty are then ignored, and each
+                move searches as deep and simulates as many games as its
+                share of the time allows
+                increment: seconds added to the time after every move
+                memory: if given, how many positions' simulation results to
+                remember from one move to the next (see RolloutStats); not
+                used by the parallel Monty games
+                evaluator: an NTupleEvaluator, or the name of a file of its
+                weights; if given, it picks between the indeterminate moves
+                instead of Monty
+                cache: a DecisionCache to look moves up in before searching
+                and to remember them in after (shared by every Minimax
+                given it; entries are kept apart by their settings), or a
+                number to make a new one of that size
+                cache_file: the file a new cache is read from, and saved to
+                by close()
+                trace: a TreeWriter, or the name of a file to make one for,
+                to write every search to (see final_trace.py); only the
+                "tree", "pvs" and "mtdf" searches without workers can be
+                traced, and close() finishes the file
+                threats: before searching, look for a win by a series of
+                threats up to this many moves long (see ThreatSearch), and
+                play it if there is one; defaults to 16, and 0 turns it off
+                extend: if given, carry on past the bottom of the search for
+                up to this many moves along forced blocks (see
+                ThreatSearch.forcing_value()), so that a threat just over
+                the horizon still counts; not for the batched search or
+                with workers
+                extend_attacks: if True, the extension also tries every
+                move that makes a threat; finds more, but is much slower
+                store: a PositionStore (see final_store.py), or the name of
+                its file, to keep on disk what the searches and the Montys
+                work out; a move whose positions are all in it, searched
+                deep enough, isn't searched again, even after a restart
+                (values are kept apart by the extend settings).
+                The Montys remember their games in it instead of memory.
+                Not for the batched search; close() writes it
         """
 
         assert player in [1, 2]
@@ -480,6 +949,142 @@ class Minimax:
             self.depth = 5
             self.monty = 100
 
+        self.monty_mode = options.pop("monty_mode", "fixed")
+        self.confidence = options.pop("confidence", 0.95)
+        self.search = options.pop("search", "tree")
+        assert self.search in ["tree", "batched"] + SEARCH_MODES
+
+        # the null-window search keeps its transposition table between moves
+        table = options.pop("table", None)
+        self.null_window = None
+        if self.search in SEARCH_MODES:
+            self.null_window = NullWindowSearch(self.search, table)
+
+        self.parallel = None
+        workers = options.pop("workers", None)
+        if workers:
+            if self.search == "pvs":
+                self.parallel = ParallelSearch(workers, "pvs", table)
+            else:
+                self.parallel = ParallelSearch(workers, "mtdf", table)
+
+        self.clock = None
+        budget = options.pop("time", None)
+        increment = options.pop("increment", 0.0)
+        if budget:
+            self.clock = TimeManager(budget, increment)
+
+        self.evaluator = options.pop("evaluator", None)
+        path = None
+        if isinstance(self.evaluator, str):
+            path = self.evaluator
+            self.evaluator = NTupleEvaluator()
+            self.evaluator.load(path)
+
+        adjudicate = options.pop("adjudicate", False)
+        adjudicate_plies = options.pop("adjudicate_plies", None)
+        self.adjudicator = None
+        if adjudicate or adjudicate_plies:
+            self.adjudicator = Adjudicator(adjudicate, adjudicate_plies)
+        self.rave = options.pop("rave", None)
+
+        leaf_rollouts = options.pop("leaf_rollouts", 2)
+        self.batched = None
+        if self.search == "batched":
+            if self.evaluator is not None:
+                self.batched = BatchedSearch(self.evaluator)
+            else:
+                self.batched = BatchedSearch(RolloutEvaluator(leaf_rollouts))
+
+        # the Montys made for each move all share one memory
+        self.stats = None
+        memory = options.pop("memory", None)
+        if memory:
+            self.stats = RolloutStats(memory)
+
+        self.store = options.pop("store", None)
+        if isinstance(self.store, str):
+            self.store = PositionStore(self.store)
+        if self.store is not None:
+            assert self.batched is None, \
+                "The batched search's scores can't be stored."
+            self.stats = self.store
+
+        # how much time the current move has, and a guess at how many Monty
+        # games a second this machine runs, which is corrected as it goes
+        self.allotment = 0.0
+        self.rollout_rate = 200.0
+
+        # the score of the last move chosen: 1 for a sure win and -1 for a
+        # sure loss, and in between if it isn't known (0 unless the batched
+        # search scored it)
+        self.score = 0
+
+        # how many positions the last move's searches visited, as far as
+        # they keep count (the parallel and batched searches don't)
+        self.nodes = 0
+
+        threats = options.pop("threats", 16)
+        self.threat_search = None
+        if threats:
+            self.threat_search = ThreatSearch(threats)
+
+        # the extension needs a ThreatSearch even if threats is off
+        extend = options.pop("extend", 0)
+        extend_attacks = options.pop("extend_attacks", False)
+        self.extension = None
+        self.analysis = None
+
+        # what the search values depend on besides the position; tables and
+        # stores shared with differently set up searches keep them apart
+        self.extension_settings = "no extension"
+        if extend:
+            self.extension_settings = "extend=%d attacks=%s" % (extend,
+                extend_attacks)
+            assert self.parallel is None and self.batched is None, \
+                "Only the tree and null-window searches can be extended."
+            forcing = ThreatSearch()
+            self.extension = lambda board, player: forcing.forcing_value(
+                board, player, extend, extend_attacks)
+            if self.null_window is not None:
+                self.null_window.extension = self.extension
+                self.null_window.settings = self.extension_settings
+            else:
+                self.analysis = NullWindowSearch()
+                self.analysis.extension = self.extension
+                self.analysis.settings = self.extension_settings
+
+        self.trace = options.pop("trace", None)
+        if isinstance(self.trace, str):
+            self.trace = TreeWriter(self.trace)
+        if self.trace is not None:
+            assert self.parallel is None and self.batched is None, \
+                "Only the tree and null-window searches can be traced."
+
+        self.cache = options.pop("cache", None)
+        cache_file = options.pop("cache_file", None)
+        if self.cache is None and cache_file:
+            self.cache = DecisionCache(path=cache_file)
+        elif isinstance(self.cache, int):
+            self.cache = DecisionCache(self.cache, cache_file or None)
+
+        # everything that can change the move chosen, which the cache keeps
+        # decisions apart by; an evaluator given as an object is only known
+        # by its type, and a store by its file (what the Montys remember
+        # changes how they play, so memory and the store count too)
+        evaluator = path
+        if path is None and self.evaluator is not None:
+            evaluator = self.evaluator.__class__.__name__
+        store = None
+        if self.store is not None:
+            store = self.store.path
+        self.settings = repr((self.depth, self.monty, self.monty_mode,
+            self.confidence, self.search, evaluator, leaf_rollouts,
+            adjudicate, adjudicate_plies, self.rave, budget, increment,
+            threats, extend, extend_attacks, memory, store))
+
+        assert not options, "Unknown Minimax options: %s" % options.keys()
+
     def chooseMove(self, board, player):
         """
         Chooses the move.
@@ -488,8 +1093,66 @@ class Minimax:
             player: analogous to "toMove"
         """
 
+        if self.clock is None:
+            return self.remember(board, player)
+
+        # nobody tells players when a new game starts, but a board with at
+        # most one piece on it can only be the first move of a game
+        if board.getKey().count("0") >= board.getCols() * board.getRows() - 1:
+            self.clock.reset()
+
+        self.clock.start()
+        try:
+            return self.remember(board, player)
+        finally:
+            self.clock.stop()
+
+    def remember(self, board, player):
+        """
+        Returns the move from the decision cache if it's there, and otherwise
+        calls decide() and puts the move in the cache.
+        """
+
+        if self.cache is None:
+            return self.decide(board, player)
+
+        found = self.cache.lookup(board, player, self.settings)
+        if found is not None:
+            move, self.score = found
+            self.nodes = 0
+            return move
+        move = self.decide(board, player)
+        self.cache.store(board, player, self.settings, move, self.score)
+        return move
+
+    def close(self):
+        """
+        Shuts down the worker processes, if there are any, and saves the
+        decision cache if it has a file and the position store if there is
+        one.
+        """
+
+        if self.parallel is not None:
+            self.parallel.close()
+        if self.trace is not None:
+            self.trace.close()
+        if self.cache is not None and self.cache.path is not None:
+            self.cache.save()
+        if self.store is not None:
+            self.store.flush()
+
+    def decide(self, board, player):
+        """
+        Does the actual work of chooseMove(), apart from the clock.
+        Arguments:
+            board: the current position on the Connect4Board
+            player: analogous to "toMove"
+        """
+
         moves = board.possibleMoves()
         assert moves != []
+        self.score = 0
+        self.nodes = 0
 
         #######
 
@@ -502,6 +1165,7 @@ class Minimax:
         # returns winning move, as before
         for move in moves:
             if board.isWinningMove(move, player):
+                self.score = 1
                 return move
 
         # winning move for the other player is the one to be blocked, and so
@@ -512,13 +1176,24 @@ class Minimax:
 
         #######
 
-        # otherwise, makes a tree and selects the best move
-
-        tree = self.Tree(board, player, self.depth)
+        # a win by threats can be far deeper than the search goes, but it's
+        # quick to look for
+        if self.threat_search is not None:
+            move = self.threat_search.forced_win(board, player)
+            self.nodes += self.threat_search.nodes
+            if move is not None:
+                self.score = 1
+                return move
 
-        # tree.pprint()
+        # otherwise, makes a tree (or searches without one) and selects the
+        # best move
 
-        move_table = tree.move_table()
+        if self.clock is not None:
+            move_table = self.timed_search(board, player)
+            n = self.timed_rollouts(len(move_table[0]))
+        else:
+            move_table = self.move_table(board, player, self.depth)
+            n = self.monty
 
         ######################
         # print(move_table)
@@ -528,15 +1203,314 @@ class Minimax:
         # a player who plays optimally, so it just chooses the first move
         # available
         if move_table[0] == [] and move_table[1] == []:
+            self.score = -1
             return min(move_table[-1])
 
         # if the computer doesn't see a guaranteed winning move, it runs a Monty
         # simulation for each of the moves that aren't guaranteed losses
         # this is what uses the optional move_list argument in the Monty class
         if move_table[1] == []:
-            monty = Monty(self.monty, player, move_table[0])
-            return monty.chooseMove(board, player)
+            # the batched search has already scored the indeterminate moves,
+            # so it takes the best (the first, on a tie)
+            if self.batched is not None:
+                scores = self.batched.scores
+                best = move_table[0][0]
+                for move in move_table[0]:
+                    if scores[move] > scores[best]:
+                        best = move
+                self.score = scores[best]
+                return best
+
+            if self.evaluator is not None:
+                return self.evaluator.best_move(board, player, move_table[0])
+
+            # the workers can't see this process's stats or rave, so with
+            # either the games are played here
+            started = time.time()
+            if self.parallel is not None and self.monty_mode == "fixed" and \
+                self.stats is None and not self.rave:
+                move = self.parallel.monty(board, player, move_table[0], n,
+                    self.adjudicator)
+                simulations = n * len(move_table[0])
+            else:
+                monty = Monty(n, player, move_table[0],
+                    mode=self.monty_mode, confidence=self.confidence,
+                    stats=self.stats, adjudicator=self.adjudicator,
+                    rave=self.rave)
+                move = monty.chooseMove(board, player)
+                simulations = monty.simulations
+
+            # keeps the guess at the speed of the simulations up to date
+            took = time.time() - started
+            if simulations and took > 0:
+                self.rollout_rate = simulations / took
+            return move
 
         # otherwise, the maximum value is 1, which means there is a winning move
         # in this case, return the first such move
-        return min(move_table[1])
\ No newline at end of file
+        self.score = 1
+        return min(move_table[1])
+
+    def move_table(self, board, player, depth):
+        """
+        Returns the dictionary of win/loss/indeterminate values for each move,
+        searched to 'depth' levels in whichever way Minimax was set up to,
+        or taken from the position store if it already knows them.
+        """
+
+        if self.store is None:
+            return self.search_table(board, player, depth)
+
+        result = self.stored_table(board, player, depth)
+        if result is None:
+            result = self.search_table(board, player, depth)
+            self.store_table(board, player, depth, result)
+        return result
+
+    def stored_table(self, board, player, depth):
+        """
+        Returns the move table from the values in the position store, in the
+        same form as the searches (stopping at the first winning move), or
+        None if any of the moves it needs isn't known deep enough.
+        """
+
+        # a win or a loss found at any depth is still one deeper down, but a
+        # value of 0 only says nothing was found as deep as it went
+        player2 = player % 2 + 1
+        result = {-1:[], 0:[], 1:[]}
+        for move in board.possibleMoves():
+            if board.isWinningMove(move, player):
+                result[1].append(move)
+                break
+
+            board.makeMove(move, player)
+            known = self.store.value(board, player2,
+                self.extension_settings)
+            board.unmakeMove(move)
+            if known is None:
+                return None
+            value, searched = known
+            if value == 0 and searched < depth - 1:
+                return None
+            result[-value].append(move)
+            if value == -1:
+                break
+        return result
+
+    def store_table(self, board, player, depth, table):
+        """
+        Puts the values of the positions after each move in a move table, and
+        of the position itself, in the position store.
+        """
+
+        player2 = player % 2 + 1
+        for value in table:
+            for move in table[value]:
+                if board.isWinningMove(move, player):
+                    continue
+                board.makeMove(move, player)
+                self.store.store_value(board, player2, -value, depth - 1,
+                    self.extension_settings)
+                board.unmakeMove(move)
+
+        # the table stops at a winning move, so the position is only known
+        # to be lost if every move is there
+        value = None
+        if table[1]:
+            value = 1
+        elif table[0]:
+            value = 0
+        elif len(table[-1]) == len(board.possibleMoves()):
+            value = -1
+        if value is not None:
+            self.store.store_value(board, player, value, depth,
+                self.extension_settings)
+
+    def search_table(self, board, player, depth):
+        """
+        Returns the move table searched to 'depth' levels (see move_table()).
+        """
+
+        if self.parallel is not None:
+            return self.parallel.move_table(board, player, depth)
+        elif self.batched is not None:
+            return self.batched.move_table(board, player, depth)
+        elif self.null_window is not None:
+            if self.trace is None:
+                result = self.null_window.move_table(board, player, depth)
+                self.nodes += self.null_window.nodes
+                return result
+            self.trace.position(board, player, depth)
+            self.null_window.trace = self.trace
+            try:
+                return self.null_window.move_table(board, player, depth)
+            finally:
+                self.null_window.trace = None
+                self.nodes += self.null_window.nodes
+
+        tree = self.Tree(board, player, depth, self.extension)
+        self.nodes += tree.nodes
+
+        # tree.pprint()
+        if self.trace is not None:
+            write_tree(tree, self.trace)
+
+        return tree.move_table()
+
+    def analyse(self, board, player, depth=None):
+        """
+        Analyses every move 'player' can make on 'board' in one search, for
+        reviewing games rather than playing them.
+        Arguments:
+            board: the position on the Connect4Board
+            player: the player to move
+            depth: how many levels to search; defaults to Minimax's depth
+        Returns a dictionary mapping each move to (score, line, depth):
+        score is 1 for a sure win and -1 for a sure loss, and otherwise the
+        evaluator's score of the position at the end of the line (0 if
+        there's no evaluator); line is the principal variation starting with
+        the move (see NullWindowSearch.analyse()); depth is the depth
+        searched.
+        """
+
+        if depth is None:
+            depth = self.depth
+
+        # the tree can't share work between the moves, so the other
+        # settings get a search of their own, kept from one call to the
+        # next for its table, and extended the same way as the tree
+        search = self.null_window
+        if search is None:
+            if self.analysis is None:
+                self.analysis = NullWindowSearch()
+            search = self.analysis
+
+        result = {}
+        for move, (value, line) in search.analyse(board, player,
+            depth).items():
+            score = value
+            if value == 0 and self.evaluator is not None:
+                score = self.line_score(board, player, line)
+            result[move] = (score, line, depth)
+        return result
+
+    def line_score(self, board, player, line):
+        """
+        Returns the evaluator's score of the position at the end of 'line'
+        for 'player', kept strictly between -1 and 1 so that it can't be
+        mistaken for a sure win or loss.
+        """
+
+        board2 = board.clone()
+        toMove = player
+        for move in line:
+            board2.makeMove(move, toMove)
+            toMove = toMove % 2 + 1
+        if board2.isDraw():
+            return 0.0
+        score = self.evaluator.evaluate(board2, toMove)
+        if toMove != player:
+            score = -score
+        return min(HIGHEST_GUESS, max(LOWEST_GUESS, score))
+
+    def timed_search(self, board, player):
+        """
+        Searches one level deeper at a time for as long as the clock allows,
+        and returns the move table of the deepest search. Half the move's
+        time is for searching; the other half is kept for Monty.
+        """
+
+        # there's no point searching deeper than the number of empty squares
+        max_depth = board.getKey().count("0")
+        growth = 4.0
+        last = None
+        depth = 1
+        while True:
+            started = time.time()
+            move_table = self.move_table(board, player, depth)
+            took = time.time() - started
+
+            # the allotment depends on how many moves are still undecided,
+            # which the deeper searches keep narrowing down
+            complexity = len(move_table[0])
+            self.allotment = self.clock.allot(board, complexity)
+            if move_table[1] != [] or complexity <= 1 or depth >= max_depth:
+                return move_table
+
+            # guesses how long the next level will take from how much longer
+            # the last one took than the one before it
+            if last:
+                growth = max(2.0, took / last)
+            last = took
+            if self.clock.elapsed() + took * growth > self.allotment / 2:
+                return move_table
+            depth += 1
+
+    def timed_rollouts(self, candidates):
+        """
+        Returns how many games Monty can simulate for each of 'candidates'
+        moves in what's left of the move's time.
+        """
+
+        left = self.allotment - self.clock.elapsed()
+        return max(1, int(left * self.rollout_rate / max(1, candidates)))
+
+
+def make_player(spec, player):
+    """
+    Creates a computer player from a short text description, so that scripts
+    can take players on the command line.
+    Arguments:
+        spec: the name of the player, optionally followed by its settings,
+        separated by colons, e.g. "better", "monty:100", "mcts:2000",
+        "minimax:6:250" or "stepped:5:100";
+        settings of the form name=value are passed as keyword options, e.g.
+        "monty:250:mode=bound"
+        player: which player the computer is going to be (1 or 2)
+    """
+
+    assert player in [1, 2]
+    fields = spec.split(":")
+    name = fields[0]
+    args = []
+    options = {}
+    for field in fields[1:]:
+        if "=" in field:
+            key, value = field.split("=", 1)
+            options[key] = spec_value(value)
+        else:
+            args.append(int(field))
+
+    if name == "random":
+        return RandomPlayer()
+    elif name == "simple":
+        return SimplePlayer()
+    elif name == "better":
+        return BetterPlayer()
+    elif name == "monty":
+        # defaults to the same number of simulations that Minimax uses
+        if args:
+            return Monty(args[0], player, **options)
+        return Monty(100, player, **options)
+    elif name == "mcts":
+        if args:
+            return Mcts(args[0], player, **options)
+        return Mcts(1000, player, **options)
+    elif name == "minimax":
+        return Minimax(player, *args, **options)
+    elif name == "stepped":
+        return SteppedMinimax(player, *args, **options)
+    raise ValueError("Invalid player name: %s" % spec)
+
+def spec_value(value):
+    """
+    Turns the text of an option in a player description into an int or a
+    float if it looks like one, and leaves it as a string otherwise.
+    """
+
+    for kind in [int, float]:
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
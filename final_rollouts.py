@@ -0,0 +1,168 @@
+'''
+final_rollouts.py
+
+This module contains the store that Monty uses to remember the results of
+its simulations from one turn to the next, and the "all moves as first"
+statistics it can use to get more out of each simulation.
+'''
+
+import math
+from collections import OrderedDict
+
+
+class RolloutStats:
+    """
+    Remembers how simulated games went from the positions they passed
+    through, so that when one of those positions comes up again on a later
+    turn, Monty can start from what it already knows instead of from
+    nothing. Keeps at most a fixed number of positions, throwing out the
+    ones that have gone unused the longest.
+    """
+
+    def __init__(self, size=100000, plies=4):
+        """
+        Attributes:
+            size: the most positions to remember
+            plies: how many positions along each simulated game to record;
+            the first few are the ones likeliest to come up in a real game
+            entries: maps a position key (with the player to move) to
+            [games, wins for player 1, wins for player 2], least recently
+            used first
+        """
+
+        assert size > 0
+        assert plies > 0
+        self.size = size
+        self.plies = plies
+        self.entries = OrderedDict()
+
+    def key(self, board, toMove):
+        """Returns the key for a position with 'toMove' to play."""
+
+        return board.getCanonicalKey() + str(toMove)
+
+    def update(self, key, winner):
+        """
+        Counts one more game from the position with this key, won by 'winner'
+        (0 for a draw).
+        """
+
+        # popping and putting back moves the entry to the recent end
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            entry = [0, 0, 0]
+        entry[0] += 1
+        if winner:
+            entry[winner] += 1
+        self.entries[key] = entry
+
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def lookup(self, key):
+        """
+        Returns [games, wins for player 1, wins for player 2] for the
+        position with this key, or None if it isn't remembered.
+        """
+
+        return self.entries.get(key)
+
+    def record(self, board, move, player, moves, winner):
+        """
+        Records a simulated game that started with 'player' making 'move' on
+        'board' and then went on with 'moves', a list of (player, column)
+        pairs.
+        """
+
+        board2 = board.clone()
+        board2.makeMove(move, player)
+        toMove = player % 2 + 1
+        self.update(self.key(board2, toMove), winner)
+        for mover, col in moves[:self.plies - 1]:
+            board2.makeMove(col, mover)
+            toMove = mover % 2 + 1
+            self.update(self.key(board2, toMove), winner)
+
+    def prior(self, board, move, player, cap):
+        """
+        Returns (wins, games) for 'player' from what's remembered about the
+        position after 'player' makes 'move' on 'board'. If more than 'cap'
+        games are remembered, both are scaled down to 'cap' games so that
+        old results don't drown out new ones.
+        """
+
+        board2 = board.clone()
+        board2.makeMove(move, player)
+        entry = self.lookup(self.key(board2, player % 2 + 1))
+        if entry is None:
+            return (0, 0)
+        games, wins = entry[0], entry[player]
+        if games > cap:
+            wins = int(round(float(wins) * cap / games))
+            games = cap
+        return (wins, games)
+
+
+class AmafStats:
+    """
+    "All moves as first" statistics for the moves from one position: every
+    simulated game from the position counts for each move the player to move
+    makes during the game, not just the first, as if it had been made first.
+    That's a rougher estimate than the games that really started with the
+    move, but there are a lot more of them, so blend() leans on it while a
+    move has had few games of its own and moves off it as they come in
+    (RAVE, after Gelly and Silver).
+
+    In Connect-4 a column only means the same move as long as nobody else
+    has played in it, since after that a piece lands higher up, so only the
+    first piece in each column counts.
+    """
+
+    def __init__(self, equivalence=300):
+        """
+        Attributes:
+            equivalence: how many games of its own a move needs before the
+            two estimates get equal weight
+            counts: maps each column to [wins, games] for the player to move
+        """
+
+        assert equivalence > 0
+        self.equivalence = equivalence
+        self.counts = {}
+
+    def record(self, player, move, moves, won):
+        """
+        Records a simulated game where 'player' made 'move' and the game then
+        went on with 'moves', a list of (player, column) pairs. 'won' is 1 if
+        'player' won and 0 if not.
+        """
+
+        seen = set()
+        for mover, col in [(player, move)] + moves:
+            if col in seen:
+                continue
+            seen.add(col)
+            if mover == player:
+                entry = self.counts.setdefault(col, [0, 0])
+                entry[0] += won
+                entry[1] += 1
+
+    def blend(self, move, wins, games):
+        """
+        Returns the win rate of 'move', given 'wins' out of 'games' that
+        really started with it, mixed with its AMAF win rate.
+        """
+
+        amaf_wins, amaf_games = self.counts.get(move, (0, 0))
+        if amaf_games == 0:
+            if games == 0:
+                return 0.0
+            return float(wins) / games
+        amaf = float(amaf_wins) / amaf_games
+        if games == 0:
+            return amaf
+
+        # beta is the weight on the AMAF rate: near 1 at first, and down to
+        # a half after 'equivalence' games
+        beta = math.sqrt(self.equivalence / (3.0 * games + self.equivalence))
+        return beta * amaf + (1 - beta) * float(wins) / games
@@ -0,0 +1,373 @@
+'''
+final_search.py
+
+This module contains a depth-first version of the search that
+Minimax.Tree does, built on null-window alpha-beta probes and a
+transposition table, so that it can skip most of the positions the tree
+would have to build.
+'''
+
+# modes that the search can run in; both find the exact win/loss/unknown
+# value of a position, they just get there differently
+SEARCH_MODES = ["pvs", "mtdf"]
+
+# every value in the search is a win (1), a loss (-1) or unknown (0) for the
+# player to move, so these are wider than any value that can come up
+LOWEST = -2
+HIGHEST = 2
+
+
+class TranspositionTable:
+    """
+    Remembers the bounds found for positions that have already been
+    searched, so that a position reached by different move orders (or
+    reached again on a later turn) isn't searched twice.
+
+    Like SharedTable (see final_table.py), the table is split into buckets
+    of two entries: the first keeps whichever position was searched deepest
+    and the second always takes the newest one, so a full table replaces
+    one entry at a time instead of forgetting everything at once.
+    """
+
+    def __init__(self, size=1000000):
+        """
+        Attributes:
+            size: the most positions to remember
+            entries: two per bucket, each None or (key, depth, lower,
+            upper), where lower and upper bound the value of the position
+            searched to that depth
+            settings: the settings of the searches using the table (see
+            NullWindowSearch.claim()), or None before any has
+        """
+
+        assert size > 0
+        self.size = size
+        self.buckets = max(1, size // 2)
+        self.entries = [None] * (2 * self.buckets)
+        self.settings = None
+
+    def bucket(self, key):
+        """Returns the index of the first entry of the bucket for a key."""
+
+        return 2 * (hash(key) % self.buckets)
+
+    def claim(self, settings):
+        """
+        Returns the settings of the searches using the table, which become
+        'settings' if none has used it yet (see NullWindowSearch.claim()).
+        """
+
+        if self.settings is None:
+            self.settings = settings
+        return self.settings
+
+    def lookup(self, key):
+        """Returns the (depth, lower, upper) stored for key, or None."""
+
+        i = self.bucket(key)
+        for entry in (self.entries[i], self.entries[i + 1]):
+            if entry is not None and entry[0] == key:
+                return entry[1:]
+        return None
+
+    def store(self, key, depth, lower, upper):
+        """Stores the bounds found for key when searched to depth."""
+
+        i = self.bucket(key)
+        entry = (key, depth, lower, upper)
+
+        # the deep slot is taken if it's empty, holds the same position, or
+        # holds a shallower search; otherwise the newest slot is
+        old = self.entries[i]
+        if old is None or old[0] == key or old[1] <= depth:
+            self.entries[i] = entry
+            newest = self.entries[i + 1]
+            if newest is not None and newest[0] == key:
+                self.entries[i + 1] = None
+        else:
+            self.entries[i + 1] = entry
+
+
+class NullWindowSearch:
+    """
+    Finds the same win/loss/unknown values as Minimax.Tree, but searches
+    depth-first on a single board with alpha-beta pruning, and never keeps
+    more than the current line in memory.
+
+    The values mean exactly what they mean in the tree: a position is a win
+    if the player to move can force four in a row within the depth, a loss
+    if the other player can, and a full board counts as a loss for the
+    player to move (i.e. a win for whoever filled it).
+    """
+
+    def __init__(self, mode="mtdf", table=None):
+        """
+        Attributes:
+            mode: "pvs" searches each root move with a principal variation
+            search, "mtdf" with a series of null-window probes
+            table: the transposition table to use; one is made if not given
+            nodes: how many positions have been visited since the last
+            call to move_table()
+            trace: if set to a TreeWriter (see final_trace.py), every
+            position searched is written to it
+            line: the moves from the start of the search to the position
+            being searched
+            extension: if set to a function taking (board, player), the
+            value of a position at the bottom of the search is whatever it
+            says instead of 0 (see ThreatSearch.forcing_value())
+            settings: describes the extension, and should be set along with
+            it; a table can only be shared by searches with the same
+            settings (see claim())
+        """
+
+        assert mode in SEARCH_MODES
+        self.mode = mode
+        if table is None:
+            table = TranspositionTable()
+        self.table = table
+        self.nodes = 0
+        self.trace = None
+        self.line = []
+        self.extension = None
+        self.settings = "no extension"
+
+    def move_table(self, board, player, depth):
+        """
+        Returns the dictionary of win/loss/indeterminate values for each move
+        that 'player' can make on 'board', searched to 'depth' levels, in
+        the same form (and with the same early stop at the first winning
+        move) as Minimax.Tree.move_table().
+        """
+
+        self.nodes = 0
+        player2 = player % 2 + 1
+        result = {-1:[], 0:[], 1:[]}
+        for move in board.possibleMoves():
+            if board.isWinningMove(move, player):
+                result[1].append(move)
+                break
+
+            board.makeMove(move, player)
+            self.line = [move]
+            value = -self.value(board, player2, depth - 1)
+            self.line = []
+            board.unmakeMove(move)
+            result[value].append(move)
+            if value == 1:
+                break
+        return result
+
+    def analyse(self, board, player, depth):
+        """
+        Returns a dictionary mapping every move 'player' can make on 'board'
+        to (value, line): its exact value searched to 'depth' levels, and
+        the principal variation, the line of best play that starts with the
+        move. Unlike move_table() it doesn't stop at a winning move. The
+        moves all share the transposition table, so the later ones, and the
+        lines, mostly come out of what the earlier searches found.
+        """
+
+        self.nodes = 0
+        player2 = player % 2 + 1
+        result = {}
+        for move in board.possibleMoves():
+            if board.isWinningMove(move, player):
+                result[move] = (1, [move])
+                continue
+
+            board.makeMove(move, player)
+            self.line = [move]
+            value = -self.value(board, player2, depth - 1)
+            line = self.principal_variation(board, player2, depth - 1,
+                -value)
+            self.line = []
+            board.unmakeMove(move)
+            result[move] = (value, [move] + line)
+        return result
+
+    def principal_variation(self, board, player, depth, value):
+        """
+        Returns the line of best play from the position, given its exact
+        value for 'player', the player to move: at each step the first move
+        (in the search's order) that keeps the value, until the depth runs
+        out or the game ends.
+        """
+
+        line = []
+        made = []
+        center = board.getCols() // 2
+        while depth > 0:
+            moves = board.possibleMoves()
+            if moves == []:
+                break
+            wins = board.winningMoves(player)
+            if wins:
+                line.append(wins[0])
+                break
+
+            moves.sort(key=lambda m: abs(m - center))
+            player2 = player % 2 + 1
+            best = None
+            for move in moves:
+                board.makeMove(move, player)
+                if -self.value(board, player2, depth - 1) == value:
+                    best = move
+                    break
+                board.unmakeMove(move)
+            if best is None:
+                break
+
+            # the move is left on the board for the next step, and they're
+            # all taken back at the end
+            line.append(best)
+            made.append(best)
+            player = player2
+            value = -value
+            depth -= 1
+
+        for move in reversed(made):
+            board.unmakeMove(move)
+        return line
+
+    def value(self, board, player, depth):
+        """
+        Returns the exact value of the position for 'player', the player to
+        move, searched to 'depth' levels.
+        """
+
+        self.claim()
+        if self.mode == "pvs":
+            return self.search(board, player, depth, LOWEST, HIGHEST)
+        return self.mtdf(board, player, depth, 0)
+
+    def claim(self):
+        """
+        Marks the table as used by searches with this one's settings, and
+        checks that no search set up differently has used it, since an
+        extended search's bounds don't hold for one without the extension
+        (or with another one), and the other way round.
+        """
+
+        used = self.table.claim(self.settings)
+        assert used == self.settings, \
+            "A table can't be shared by searches with different settings " \
+            "(%s and %s)." % (used, self.settings)
+
+    def mtdf(self, board, player, depth, guess):
+        """
+        Finds the value of the position using only null-window probes, each
+        of which just asks whether the value is at least some number. With
+        only three possible values this takes at most two probes.
+        """
+
+        g = guess
+        lower = -1
+        upper = 1
+        while lower < upper:
+            gamma = max(g, lower + 1)
+            g = self.search(board, player, depth, gamma - 1, gamma)
+            if g < gamma:
+                upper = g
+            else:
+                lower = g
+        return g
+
+    def search(self, board, player, depth, alpha, beta):
+        """
+        The principal variation search itself, in negamax form: the value is
+        always for the player to move, and a child's value is negated on the
+        way up. Only values strictly between alpha and beta are exact; if the
+        value is alpha or less (or beta or more), what comes back is just a
+        bound on it.
+        Arguments:
+            board: the position; moves are made and unmade on it, so it ends
+            up as it started
+            player: the player to move
+            depth: how many more levels to search
+            alpha, beta: the search window
+        """
+
+        if self.trace is None:
+            return self.probe(board, player, depth, alpha, beta)
+
+        value = self.probe(board, player, depth, alpha, beta)
+        if value <= alpha:
+            bound = "<="
+        elif value >= beta:
+            bound = ">="
+        else:
+            bound = "="
+        self.trace.node(self.line, value, depth, bound)
+        return value
+
+    def probe(self, board, player, depth, alpha, beta):
+        """Does the work of search(), apart from the trace."""
+
+        self.nodes += 1
+
+        # same order of checks as subtree_maker(), which gives the same
+        # "draws are losses" rule at a full board
+        moves = board.possibleMoves()
+        if moves == []:
+            return -1
+        if depth == 0:
+            if self.extension is not None:
+                return self.extension(board, player)
+            return 0
+
+        key = board.getCanonicalKey() + str(player)
+        entry = self.table.lookup(key)
+        if entry is not None and entry[0] == depth:
+            lower, upper = entry[1], entry[2]
+            if lower >= beta:
+                return lower
+            if upper <= alpha:
+                return upper
+            if lower == upper:
+                return lower
+            alpha = max(alpha, lower)
+            beta = min(beta, upper)
+
+        for move in moves:
+            if board.isWinningMove(move, player):
+                self.table.store(key, depth, 1, 1)
+                return 1
+
+        # trying the middle columns first finds cutoffs sooner
+        center = board.getCols() // 2
+        moves.sort(key=lambda m: abs(m - center))
+
+        player2 = player % 2 + 1
+        best = LOWEST
+        a = alpha
+        for i, move in enumerate(moves):
+            board.makeMove(move, player)
+            self.line.append(move)
+
+            # the first move gets the full window and is assumed to be the
+            # best; the rest only get a null window to check that they're
+            # not better, and are searched again if it turns out they are
+            if i == 0:
+                score = -self.search(board, player2, depth - 1, -beta, -a)
+            else:
+                score = -self.search(board, player2, depth - 1, -a - 1, -a)
+                if a < score < beta:
+                    score = -self.search(board, player2, depth - 1, -beta,
+                        -score)
+            self.line.pop()
+            board.unmakeMove(move)
+
+            if score > best:
+                best = score
+            if best > a:
+                a = best
+            if a >= beta:
+                break
+
+        if best <= alpha:
+            self.table.store(key, depth, -1, best)
+        elif best >= beta:
+            self.table.store(key, depth, best, 1)
+        else:
+            self.table.store(key, depth, best, best)
+        return best
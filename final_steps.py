@@ -0,0 +1,364 @@
+'''
+final_steps.py
+
+This module contains a version of Minimax that does its work in small
+steps instead of all in one go, so that one process can take turns between
+several searches (e.g. one for each of many games being played at once),
+and a search can be stopped and picked up again later, without threads.
+
+Everything that works in steps has a step() method that does a bounded
+amount of work and returns True once it's finished; Scheduler takes turns
+calling them.
+'''
+
+from final_board import *
+from final_search import LOWEST, HIGHEST
+
+
+class SteppedSearch:
+    """
+    Finds the same win/loss/indeterminate move table as Minimax.Tree, with
+    an alpha-beta search that keeps its own stack instead of recursing, so
+    that it can stop after any position and carry on from there.
+    """
+
+    def __init__(self, board, player, depth, slice=256):
+        """
+        Attributes:
+            board: the position to search; moves are made and unmade on it,
+            so it's only as it started once the search has finished
+            player, depth: as for Minimax.Tree
+            slice: how many positions each step() visits at most
+            nodes: how many positions have been visited so far
+            result: the move table, once the search has finished
+            done: whether the search has finished
+        """
+
+        assert slice > 0
+        self.board = board
+        self.player = player
+        self.depth = depth
+        self.slice = slice
+        self.nodes = 0
+        self.result = None
+        self.done = False
+        self.work = self.run()
+
+    def step(self):
+        """
+        Searches up to 'slice' more positions. Returns True once the search
+        has finished.
+        """
+
+        if not self.done:
+            try:
+                self.work.next()
+            except StopIteration:
+                self.done = True
+        return self.done
+
+    def finish(self):
+        """Runs the search to the end and returns the move table."""
+
+        while not self.step():
+            pass
+        return self.result
+
+    def run(self):
+        """
+        The search itself, as a generator that yields every 'slice'
+        positions. Fills in self.result at the end.
+        """
+
+        board = self.board
+        player = self.player
+        player2 = player % 2 + 1
+        result = {-1:[], 0:[], 1:[]}
+        for move in board.possibleMoves():
+            if board.isWinningMove(move, player):
+                result[1].append(move)
+                break
+
+            board.makeMove(move, player)
+            for pause in self.value(player2, self.depth - 1):
+                yield pause
+            board.unmakeMove(move)
+            result[-self.last].append(move)
+            if self.last == -1:
+                break
+        self.result = result
+
+    def open(self, player, depth, alpha, beta):
+        """
+        Starts on a position: returns (value, None) if its value is already
+        known, or (None, frame) for a new frame of the stack, which holds
+        [player, depth, alpha, beta, moves, index of the next move, best
+        value so far].
+        """
+
+        board = self.board
+
+        # same order of checks as subtree_maker(), so full boards are
+        # losses for the player to move
+        moves = board.possibleMoves()
+        if moves == []:
+            return (-1, None)
+        if depth == 0:
+            return (0, None)
+        if board.winningMoves(player):
+            return (1, None)
+
+        center = board.getCols() // 2
+        moves.sort(key=lambda m: abs(m - center))
+        return (None, [player, depth, alpha, beta, moves, 0, LOWEST])
+
+    def value(self, player, depth):
+        """
+        Finds the exact value of the position on the board for 'player', the
+        player to move, as a generator that yields every 'slice' positions
+        and leaves the value in self.last.
+        """
+
+        board = self.board
+        value, frame = self.open(player, depth, LOWEST, HIGHEST)
+        stack = []
+        if frame is not None:
+            stack.append(frame)
+
+        while stack:
+            frame = stack[-1]
+            player, depth, alpha, beta, moves, i, best = frame
+
+            # a child has just been finished, so its move is taken back and
+            # its value counted, negated as it's for the other player
+            if value is not None:
+                board.unmakeMove(moves[i - 1])
+                best = max(best, -value)
+                alpha = max(alpha, best)
+                value = None
+                if alpha >= beta:
+                    i = len(moves)
+                frame[2], frame[5], frame[6] = alpha, i, best
+
+            if i == len(moves):
+                stack.pop()
+                value = best
+                continue
+
+            move = moves[i]
+            frame[5] = i + 1
+            board.makeMove(move, player)
+            self.nodes += 1
+            if self.nodes % self.slice == 0:
+                yield None
+
+            value, child = self.open(player % 2 + 1, depth - 1, -beta,
+                -alpha)
+            if child is not None:
+                stack.append(child)
+
+        self.last = value
+
+
+class SteppedMinimax:
+    """
+    Chooses moves the way Minimax does with the tree search and the fixed
+    Monty mode (make or block a win, search, then simulate games for the
+    undecided moves), but in steps: a slice of the search, or one simulated
+    game, at a time.
+    """
+
+    def __init__(self, player, depth=5, monty=100, slice=256):
+        """
+        Attributes:
+            player: which player the computer is going to be (1 or 2)
+            depth, monty: as for Minimax
+            slice: how many positions each step of the search visits
+            move: the move chosen, once it has been
+            nodes: how many positions the search for it visited
+            done: whether the current move has been chosen
+        """
+
+        self.player = player
+        self.depth = depth
+        self.monty = monty
+        self.slice = slice
+        self.move = None
+        self.nodes = 0
+        self.done = True
+        self.work = None
+
+    def start(self, board, player):
+        """Starts choosing a move for 'player' on 'board'."""
+
+        self.move = None
+        self.nodes = 0
+        self.done = False
+        self.work = self.decide(board.clone(), player)
+
+    def step(self):
+        """
+        Does one step of choosing the move. Returns True once self.move has
+        been chosen.
+        """
+
+        if not self.done:
+            try:
+                self.work.next()
+            except StopIteration:
+                self.done = True
+        return self.done
+
+    def chooseMove(self, board, player):
+        """
+        Chooses a move all in one go, so that this can play anywhere the
+        other players can.
+        """
+
+        self.start(board, player)
+        while not self.step():
+            pass
+        return self.move
+
+    def decide(self, board, player):
+        """The work of choosing the move, as a generator of steps."""
+
+        # imported here because final_players imports this module
+        from final_players import Monty
+
+        player2 = player % 2 + 1
+        wins = board.winningMoves(player)
+        if wins:
+            self.move = wins[0]
+            return
+        blocks = board.winningMoves(player2)
+        if blocks:
+            self.move = blocks[0]
+            return
+
+        search = SteppedSearch(board, player, self.depth, self.slice)
+        while not search.step():
+            yield None
+        self.nodes = search.nodes
+        move_table = search.result
+
+        if move_table[1] != []:
+            self.move = min(move_table[1])
+            return
+        if move_table[0] == []:
+            self.move = min(move_table[-1])
+            return
+
+        # one simulated game per step, taking turns between the moves so
+        # that the win rates are always comparable
+        monty = Monty(self.monty, player)
+        wins = dict([(move, 0) for move in move_table[0]])
+        for i in range(self.monty):
+            for move in move_table[0]:
+                wins[move] += monty.rollout(board, move, player)
+                yield None
+
+        # same choice as Monty: the first move with the most wins
+        best = move_table[0][0]
+        for move in move_table[0]:
+            if wins[move] > wins[best]:
+                best = move
+        self.move = best
+
+
+class SteppedGame:
+    """
+    A game between two players that choose their moves in steps (like
+    SteppedMinimax), played a step at a time.
+    """
+
+    def __init__(self, player1, player2, toMove=1):
+        """
+        Attributes:
+            players: the two players, by number
+            toMove: the player to move
+            board: the game so far
+            winner: once the game is over, the winner (0 for a draw)
+            done: whether the game is over
+            thinking: whether the player to move has started on its move
+        """
+
+        assert toMove in [1, 2]
+        self.players = {1: player1, 2: player2}
+        self.toMove = toMove
+        self.board = Connect4Board()
+        self.winner = None
+        self.done = False
+        self.thinking = False
+
+    def step(self):
+        """
+        Does one step of the player to move's thinking, and makes its move
+        if it has finished. Returns True once the game is over.
+        """
+
+        if self.done:
+            return True
+        player = self.players[self.toMove]
+        if not self.thinking:
+            player.start(self.board, self.toMove)
+            self.thinking = True
+        if not player.step():
+            return False
+
+        self.thinking = False
+        self.board.makeMove(player.move, self.toMove)
+        if self.board.isWin(player.move):
+            self.winner = self.toMove
+            self.done = True
+        elif self.board.isDraw():
+            self.winner = 0
+            self.done = True
+        self.toMove = self.toMove % 2 + 1
+        return self.done
+
+
+class Scheduler:
+    """
+    Takes turns between any number of things that work in steps, giving
+    each one step at a time, so they all move along at the same rate.
+    Anything can be added at any time, and run() can be stopped after a
+    number of steps and called again later to carry on.
+    """
+
+    def __init__(self):
+        """
+        Attributes:
+            tasks: everything that hasn't finished yet, in turn order
+            finished: everything that has, in the order they finished
+            steps: how many steps have been run in all
+        """
+
+        self.tasks = []
+        self.finished = []
+        self.steps = 0
+
+    def add(self, task):
+        """Adds something with a step() method to the turns."""
+
+        self.tasks.append(task)
+
+    def run(self, max_steps=None):
+        """
+        Runs steps in turn until everything has finished, or until
+        'max_steps' steps have been run. Returns True if everything has
+        finished.
+        """
+
+        run = 0
+        while self.tasks:
+            if max_steps is not None and run >= max_steps:
+                return False
+            task = self.tasks.pop(0)
+            run += 1
+            self.steps += 1
+            if task.step():
+                self.finished.append(task)
+            else:
+                self.tasks.append(task)
+        return True
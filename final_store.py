@@ -0,0 +1,195 @@
+'''
+final_store.py
+
+This module contains a store of what the engines have worked out about
+positions (search values and simulated games), kept on disk in an SQLite
+database so that it builds up from one run to the next instead of being
+lost whenever the process exits.
+'''
+
+import time
+import sqlite3
+from final_rollouts import *
+
+
+class PositionStore(RolloutStats):
+    """
+    Remembers, for each position (mirror images together, with the player
+    to move), how the games simulated from it went, and its value from the
+    deepest search so far for each group of search settings that has
+    searched it (searches set up differently, e.g. with and without an
+    extension, don't agree on what a value means, so they don't share
+    them). Monty can use it anywhere it takes a RolloutStats.
+
+    Changes are kept in memory and written in batches, in one transaction
+    each, and merged with what's in the database rather than written over
+    it: game counts are added on, and a value only replaces one that's
+    shallower or undecided. So any number of processes can write to the
+    same file without losing each other's work, and as it's in write-ahead
+    log mode, others can read it while one writes. When there are more
+    positions than its size, the ones changed longest ago are thrown out.
+    """
+
+    def __init__(self, path, size=1000000, batch=1000, plies=4):
+        """
+        Attributes:
+            path: the database file; made if it doesn't exist
+            size: the most positions to keep, for the games and for the
+            values each
+            batch: how many changed positions to hold before writing them
+            plies: as for RolloutStats
+            games: maps each position's key to [games, wins for player 1,
+            wins for player 2] simulated since the last write
+            values: maps (key, settings) to [value, depth] for the values
+            found since the last write
+            db: the connection to the database
+        """
+
+        RolloutStats.__init__(self, size, plies)
+        assert batch > 0
+        self.path = path
+        self.batch = batch
+        self.games = {}
+        self.values = {}
+
+        # readers can wait a while for a writer to finish, but no longer
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS games (
+            key TEXT PRIMARY KEY, games INTEGER, wins1 INTEGER,
+            wins2 INTEGER, used REAL)""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS games_used
+            ON games (used)""")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS search_values (
+            key TEXT, settings TEXT, value INTEGER, depth INTEGER,
+            used REAL, PRIMARY KEY (key, settings))""")
+        self.db.execute("""CREATE INDEX IF NOT EXISTS search_values_used
+            ON search_values (used)""")
+        self.db.commit()
+
+    def pending(self):
+        """Returns how many changes are waiting to be written."""
+
+        return len(self.games) + len(self.values)
+
+    def update(self, key, winner):
+        """
+        Counts one more simulated game from the position with this key, won
+        by 'winner' (0 for a draw).
+        """
+
+        entry = self.games.get(key)
+        if entry is None:
+            if self.pending() >= self.batch:
+                self.flush()
+            entry = [0, 0, 0]
+            self.games[key] = entry
+        entry[0] += 1
+        if winner:
+            entry[winner] += 1
+
+    def lookup(self, key):
+        """
+        Returns [games, wins for player 1, wins for player 2] for the
+        position with this key, or None, as RolloutStats does.
+        """
+
+        row = self.db.execute("""SELECT games, wins1, wins2 FROM games
+            WHERE key = ?""", (key,)).fetchone()
+        entry = self.games.get(key)
+        if row is None:
+            return entry
+        row = list(row)
+        if entry is not None:
+            row = [row[i] + entry[i] for i in range(3)]
+        return row
+
+    def value(self, board, toMove, settings=""):
+        """
+        Returns (value, depth) for 'toMove' from the deepest search of the
+        position so far with these settings, or None if there's been none.
+        """
+
+        key = self.key(board, toMove)
+        row = self.db.execute("""SELECT value, depth FROM search_values
+            WHERE key = ? AND settings = ?""", (key, settings)).fetchone()
+        entry = self.values.get((key, settings))
+        if entry is None:
+            return row
+        if row is None or better(entry[0], entry[1], row[0], row[1]):
+            return tuple(entry)
+        return tuple(row)
+
+    def store_value(self, board, toMove, value, depth, settings=""):
+        """
+        Remembers that the position is worth 'value' for 'toMove' when
+        searched to 'depth' levels with these settings, unless something
+        better is already known (see better()).
+        """
+
+        key = (self.key(board, toMove), settings)
+        entry = self.values.get(key)
+        if entry is None:
+            if self.pending() >= self.batch:
+                self.flush()
+            self.values[key] = [value, depth]
+        elif better(value, depth, entry[0], entry[1]):
+            entry[0] = value
+            entry[1] = depth
+
+    def flush(self):
+        """
+        Merges every pending change into the database, then throws out any
+        extra positions.
+        """
+
+        if not self.pending():
+            return
+        now = time.time()
+        self.db.executemany("""INSERT INTO games
+            (key, games, wins1, wins2, used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+            games = games + excluded.games, wins1 = wins1 + excluded.wins1,
+            wins2 = wins2 + excluded.wins2, used = excluded.used""",
+            [(key, e[0], e[1], e[2], now)
+            for key, e in self.games.items()])
+
+        # the same test as better(), in SQL, so that another process's value
+        # written since this one last looked isn't lost
+        self.db.executemany("""INSERT INTO search_values
+            (key, settings, value, depth, used) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (key, settings) DO UPDATE SET
+            value = excluded.value, depth = excluded.depth,
+            used = excluded.used
+            WHERE value = 0 AND (excluded.value != 0 OR
+            excluded.depth > depth)""",
+            [(key, settings, e[0], e[1], now)
+            for (key, settings), e in self.values.items()])
+
+        for table in ["games", "search_values"]:
+            count = self.db.execute("SELECT COUNT(*) FROM %s" %
+                table).fetchone()[0]
+            if count > self.size:
+                self.db.execute("""DELETE FROM %s WHERE rowid IN
+                    (SELECT rowid FROM %s ORDER BY used LIMIT ?)""" % (
+                    table, table), (count - self.size,))
+        self.db.commit()
+        self.games = {}
+        self.values = {}
+
+    def close(self):
+        """Writes every pending change and closes the database."""
+
+        self.flush()
+        self.db.close()
+
+
+def better(value, depth, old_value, old_depth):
+    """
+    Returns whether a value found to 'depth' should replace 'old_value'
+    found to 'old_depth'. A win or a loss is kept whatever comes after it,
+    as a deeper search with the same settings can only find the same (0
+    just means the search didn't find out).
+    """
+
+    return old_value == 0 and (value != 0 or depth > old_depth)
@@ -0,0 +1,142 @@
+'''
+final_table.py
+
+This module contains a transposition table that lives in shared memory, so
+that every search process on a machine can use the same one. It works as a
+drop-in replacement for TranspositionTable in final_search.py.
+'''
+
+import ctypes
+from multiprocessing.sharedctypes import Array, RawArray
+
+# bits of each entry used for the search depth and for each bound
+DEPTH_BITS = 6
+BOUND_BITS = 2
+DATA_BITS = DEPTH_BITS + 2 * BOUND_BITS
+
+# a large odd number for scrambling position codes into bucket numbers
+SCRAMBLE = 0x9E3779B97F4A7C15
+MASK = (1 << 64) - 1
+
+# the longest settings description the table can keep
+SETTINGS_SIZE = 64
+
+
+def position_code(key, rows):
+    """
+    Packs a position key from final_search (the board key followed by the
+    player to move) into a single number.
+
+    Each column becomes rows + 1 bits: a 1 just above the top piece, and
+    below it one bit per piece that's 1 for player 1's pieces. That's enough
+    to tell every position apart, and it's how this table fits a key and
+    its data into one 64-bit word.
+    """
+
+    code = 0
+    for c in range(len(key) // rows):
+        column = key[c * rows:(c + 1) * rows]
+        height = rows - column.count("0")
+        bits = 1 << height
+        for i in range(height):
+            if column[i] == "1":
+                bits |= 1 << i
+        code = (code << (rows + 1)) | bits
+    return (code << 1) | (int(key[-1]) - 1)
+
+
+class SharedTable:
+    """
+    A fixed-size transposition table in shared memory. Every entry is a
+    single 64-bit word holding both the position and what's known about it,
+    so a read or write of an entry can never be torn between two processes,
+    and no locks are needed: at worst two processes overwrite each other's
+    entries, which a transposition table can live with.
+
+    The table is split into buckets of two entries. The first keeps
+    whichever position was searched deepest (deeper searches are more
+    expensive to redo); the second always takes the newest one.
+
+    Must be made before the processes that share it are started.
+    """
+
+    def __init__(self, size=1 << 20, rows=6, cols=7):
+        """
+        Attributes:
+            size: the number of buckets
+            rows, cols: the size of the board the keys come from
+            entries: the shared array, two words per bucket
+            settings: as for TranspositionTable, but shared too, so that
+            searches in different processes can't use it with different
+            settings either; empty before any has
+        """
+
+        assert size > 0
+        assert cols * (rows + 1) + 1 + DATA_BITS <= 64, "Board too big."
+        self.size = size
+        self.rows = rows
+        self.entries = RawArray(ctypes.c_uint64, 2 * size)
+        self.settings = Array(ctypes.c_char, SETTINGS_SIZE)
+
+    def bucket(self, code):
+        """Returns the index of the first entry of the bucket for a code."""
+
+        return 2 * ((((code * SCRAMBLE) & MASK) >> 20) % self.size)
+
+    def claim(self, settings):
+        """As TranspositionTable.claim(), for every process at once."""
+
+        assert 0 < len(settings) < SETTINGS_SIZE
+        self.settings.get_lock().acquire()
+        if not self.settings.value:
+            self.settings.value = settings
+        used = self.settings.value
+        self.settings.get_lock().release()
+        return used
+
+    def lookup(self, key):
+        """Returns the (depth, lower, upper) stored for key, or None."""
+
+        code = position_code(key, self.rows)
+        i = self.bucket(code)
+        for word in (self.entries[i], self.entries[i + 1]):
+            if word >> DATA_BITS == code:
+                return unpack(word)
+        return None
+
+    def store(self, key, depth, lower, upper):
+        """Stores the bounds found for key when searched to depth."""
+
+        code = position_code(key, self.rows)
+        word = (code << DATA_BITS) | pack(depth, lower, upper)
+        i = self.bucket(code)
+
+        # the deep slot is taken if it's empty, holds the same position, or
+        # holds a shallower search; otherwise the newest slot is
+        old = self.entries[i]
+        if old == 0 or old >> DATA_BITS == code or unpack(old)[0] <= depth:
+            self.entries[i] = word
+        else:
+            self.entries[i + 1] = word
+
+    def clear(self):
+        """Empties the table."""
+
+        ctypes.memset(self.entries, 0, ctypes.sizeof(self.entries))
+
+
+def pack(depth, lower, upper):
+    """Packs a depth and two bounds of -1, 0 or 1 into DATA_BITS bits."""
+
+    assert 0 <= depth < 1 << DEPTH_BITS
+    return (depth << 2 * BOUND_BITS) | ((lower + 1) << BOUND_BITS) | \
+        (upper + 1)
+
+
+def unpack(word):
+    """Does the opposite of pack(), ignoring the position bits of word."""
+
+    depth = (word >> 2 * BOUND_BITS) & ((1 << DEPTH_BITS) - 1)
+    lower = ((word >> BOUND_BITS) & ((1 << BOUND_BITS) - 1)) - 1
+    upper = (word & ((1 << BOUND_BITS) - 1)) - 1
+    return (depth, lower, upper)
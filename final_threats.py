@@ -0,0 +1,178 @@
+'''
+final_threats.py
+
+This module contains a threat-space search, which looks for wins made out
+of a series of threats, each of which the other player has to block, until
+there are two at once. It only looks at those moves, so it can see wins far
+deeper than a full-width search of the same cost.
+'''
+
+
+class ThreatSearch:
+    """
+    Searches for a forced win by threats alone: the attacker only plays
+    moves that threaten to win straight away, and the defender only plays
+    the block each one forces. A win found is a real one, since the defender
+    never had a choice; not finding one doesn't mean there isn't a win some
+    other way.
+    """
+
+    def __init__(self, plies=16):
+        """
+        Attributes:
+            plies: the most moves (both players') a win can take
+            failed: the positions (with attacker and plies left) already
+            shown not to be wins by threats, so they're not searched twice
+            nodes: how many positions the last call to forced_win() visited
+            line: the moves of the win the last call found, attacker's and
+            defender's in turn
+        """
+
+        assert plies > 0
+        self.plies = plies
+        self.failed = set()
+        self.nodes = 0
+        self.line = []
+
+    def forced_win(self, board, player):
+        """
+        Returns a move that starts a forced win by threats for 'player' on
+        'board', or None if there isn't one within 'plies'. The board state
+        does not change.
+        """
+
+        self.nodes = 0
+        self.line = []
+
+        # the table only holds for one search, as the limit on plies is
+        # counted from the start of it
+        self.failed.clear()
+        if self.attack(board, player, self.plies):
+            return self.line[0]
+        return None
+
+    def attack(self, board, attacker, plies):
+        """
+        Returns True if 'attacker', to move, can win by threats within
+        'plies' moves, leaving the moves of the win in self.line.
+        """
+
+        self.nodes += 1
+        wins = board.winningMoves(attacker)
+        if wins:
+            self.line.append(wins[0])
+            return True
+        if plies < 3:
+            return False
+
+        key = board.getCanonicalKey() + str(attacker) + str(plies)
+        if key in self.failed:
+            return False
+
+        # if the defender is threatening to win, the attacker has to block,
+        # and can only carry on if the block is a threat too
+        defender = attacker % 2 + 1
+        blocks = board.winningMoves(defender)
+        if len(blocks) > 1:
+            self.failed.add(key)
+            return False
+        if blocks:
+            moves = blocks
+        else:
+            moves = board.possibleMoves()
+
+        for move in moves:
+            board.makeMove(move, attacker)
+            if self.threatens(board, attacker, defender, move, plies):
+                board.unmakeMove(move)
+                return True
+            board.unmakeMove(move)
+
+        self.failed.add(key)
+        return False
+
+    def threatens(self, board, attacker, defender, move, plies):
+        """
+        Returns True if the attacker's 'move', just made on 'board', forces a
+        win: it makes a threat the defender has to block, and the attacker
+        wins by threats after the block.
+        """
+
+        threats = board.winningMoves(attacker)
+        if not threats:
+            return False
+
+        # the move might have let the defender win on top of it
+        if board.winningMoves(defender):
+            return False
+
+        # two threats can't both be blocked
+        if len(threats) > 1:
+            self.line.extend([move, threats[0], threats[1]])
+            return True
+
+        # the block might win the game for the defender instead
+        block = threats[0]
+        board.makeMove(block, defender)
+        if board.isWin(block):
+            board.unmakeMove(block)
+            return False
+        self.line.extend([move, block])
+        if self.attack(board, attacker, plies - 2):
+            board.unmakeMove(block)
+            return True
+        del self.line[-2:]
+        board.unmakeMove(block)
+        return False
+
+    def forcing_value(self, board, player, plies, attacks=False):
+        """
+        Returns the value of the position for 'player', the player to move,
+        found by carrying on past the end of a search along forcing moves
+        only: 1 if the player wins by force, -1 if they lose by force and 0
+        if the position is quiet (nobody has to do anything) before then.
+        Arguments:
+            board: the position; moves are made and unmade on it, so it ends
+            up as it started
+            player: the player to move
+            plies: the most moves to carry on for
+            attacks: if True, a player who doesn't have to block may also
+            try each move that makes a threat, instead of stopping there;
+            that finds more, but costs a lot more at every quiet position
+        """
+
+        self.nodes += 1
+
+        # a full board is a loss for the player to move, as in the search
+        moves = board.possibleMoves()
+        if moves == []:
+            return -1
+        if board.winningMoves(player):
+            return 1
+
+        player2 = player % 2 + 1
+        threats = board.winningMoves(player2)
+        if len(threats) > 1:
+            return -1
+        if plies == 0:
+            return 0
+
+        # a threat has to be blocked, so that's the only move
+        if threats:
+            board.makeMove(threats[0], player)
+            value = -self.forcing_value(board, player2, plies - 1, attacks)
+            board.unmakeMove(threats[0])
+            return value
+
+        best = 0
+        if attacks:
+            for move in moves:
+                board.makeMove(move, player)
+                if board.winningMoves(player) and \
+                    not board.winningMoves(player2):
+                    best = max(best,
+                        -self.forcing_value(board, player2, plies - 1, True))
+                board.unmakeMove(move)
+                if best == 1:
+                    break
+        return best
@@ -0,0 +1,136 @@
+'''
+final_trace.py
+
+This module writes Minimax's search trees to a file as they're searched,
+one line per position, instead of keeping them in memory to print, and
+reads them back a subtree at a time. Files whose names end in .gz are
+compressed.
+
+Each search starts with a line
+  # KEY PLAYER DEPTH
+giving the board key of the position, the player to move and the depth
+searched, followed by one line per position visited:
+  PATH VALUE DEPTH BOUND
+where PATH is the columns played from the start of the search, one digit
+each ("-" for the start itself), VALUE is the value for the player to move
+there (1 a win, -1 a loss, 0 not known), DEPTH is how many more levels were
+searched below it, and BOUND is "=" if the value is exact, or ">=" or "<="
+if a null-window search only found it to be at least or at most that.
+Positions are written once their value is known, so children come before
+their parents, and a position can come up more than once when the search
+goes over it again.
+'''
+
+import gzip
+
+
+def open_file(path, mode):
+    """Opens a trace file, compressed if its name ends in .gz."""
+
+    if path.endswith(".gz"):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class TreeWriter:
+    """
+    Writes search trees to a trace file, a line at a time, so it never
+    holds more than the line being written.
+    """
+
+    def __init__(self, path, levels=None):
+        """
+        Attributes:
+            path: the file to write
+            levels: if given, only positions at most this many moves from
+            the start of each search are written, to keep the file small
+            lines: how many position lines have been written
+        """
+
+        self.path = path
+        self.levels = levels
+        self.lines = 0
+        self.f = open_file(path, "w")
+
+    def position(self, board, player, depth):
+        """Starts a new search from 'board' with 'player' to move."""
+
+        self.f.write("# %s %d %d\n" % (board.getKey(), player, depth))
+
+    def node(self, line, value, depth, bound="="):
+        """
+        Writes one position, reached by the list of columns 'line' from the
+        start of the search.
+        """
+
+        if self.levels is not None and len(line) > self.levels:
+            return
+        path = "".join([str(move) for move in line]) or "-"
+        self.f.write("%s %d %d %s\n" % (path, value, depth, bound))
+        self.lines += 1
+
+    def close(self):
+        """Finishes the file."""
+
+        self.f.close()
+
+
+def write_tree(tree, writer):
+    """
+    Writes a whole Minimax.Tree to a TreeWriter, children before parents as
+    a search would. The tree's own values are for the player who moved into
+    each node, so they're turned around to be for the player to move.
+    """
+
+    writer.position(tree.board, tree.player, tree.depth)
+    write_node(tree.top, [], tree.depth, writer)
+
+
+def write_node(node, line, depth, writer):
+    """Writes the subtree of one node of a Minimax.Tree; see write_tree()."""
+
+    for sub in node.getSubs():
+        line.append(sub.getMove())
+        write_node(sub, line, depth - 1, writer)
+        line.pop()
+    writer.node(line, -node.getValue(), depth)
+
+
+def read_tree(path, prefix="", plies=None, key=None):
+    """
+    Reads a trace file back a line at a time, so files far bigger than
+    memory can be looked through.
+    Arguments:
+        path: the trace file
+        prefix: only positions in the subtree reached by these columns
+        (a string of digits) are read
+        plies: if given, only positions at most this many moves below the
+        prefix are read
+        key: if given, only searches from the position with this board key
+        are read
+    Yields (search, path, value, depth, bound) for each position, where
+    search is the (key, player, depth) of the search it's from and path is
+    the string of columns played ("" for the start of the search).
+    """
+
+    f = open_file(path, "r")
+    search = None
+    for line in f:
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == "#":
+            search = (fields[1], int(fields[2]), int(fields[3]))
+            continue
+        if key is not None and (search is None or search[0] != key):
+            continue
+
+        moves = fields[0]
+        if moves == "-":
+            moves = ""
+        if not moves.startswith(prefix):
+            continue
+        if plies is not None and len(moves) - len(prefix) > plies:
+            continue
+        yield (search, moves, int(fields[1]), int(fields[2]), fields[3])
+    f.close()